@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Correlations between languages and between cuisines, seriation of the heatmap axes
+
+Correlations are computed on the pages available for both variables (pairwise-complete), with blocks of matrix
+products. Axes are ordered by average-linkage hierarchical clustering on 1 - correlation (the matrices stored by step 4
+when available), the last ANALYSIS_CACHE_SIZE linkages being cached by their input and the settings
+"""
+import hashlib
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+import defs
+
+from storage import load_from_file, save_to_file, exists
+
+
+def _prepare(values, method):
+    """Return the values correlated: log lengths (pearson) or ranks among the available values (spearman)"""
+    if method == 'pearson':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log(np.where(values > 0, values, np.nan))
+    if method == 'spearman':
+        return pd.DataFrame(values).rank(axis=0).to_numpy()
+    raise ValueError(f"Undefined correlation method: {method}")
+
+
+def correlation(values, method='pearson', min_periods=3, block_size=512):
+    """Return the correlation matrix of the columns of values, NaN being missing values
+
+    Every pair is computed on the rows where both columns have a value (NaN with less than min_periods of them).
+    With missing values, Spearman ranks depend on the rows of every pair: they are ranked again for each pair by
+    pandas (slower), otherwise they are computed once per column
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if method == 'spearman' and np.isnan(values).any():
+        return pd.DataFrame(values).corr(method='spearman', min_periods=min_periods).to_numpy()
+    x = _prepare(values, method)
+    valid = ~np.isnan(x)
+    # Centered values reduce the cancellation in the sums below
+    with np.errstate(invalid='ignore'):
+        xm = np.where(valid, x - np.nanmean(np.where(valid, x, np.nan), axis=0), 0)
+    mm = valid.astype(np.float64)
+    x2 = xm**2
+    n_vars = x.shape[1]
+    corr = np.empty((n_vars, n_vars))
+    # The matrix is symmetric, only the blocks on and above the diagonal are computed
+    for start in range(0, n_vars, block_size):
+        rows = slice(start, start + block_size)
+        for col_start in range(start, n_vars, block_size):
+            cols = slice(col_start, col_start + block_size)
+            nn = mm[:, rows].T @ mm[:, cols]
+            sx, sy = xm[:, rows].T @ mm[:, cols], mm[:, rows].T @ xm[:, cols]
+            cov = nn * (xm[:, rows].T @ xm[:, cols]) - sx * sy
+            var = (nn * (x2[:, rows].T @ mm[:, cols]) - sx**2) * (nn * (mm[:, rows].T @ x2[:, cols]) - sy**2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rr = cov / np.sqrt(var)
+            rr[(nn < min_periods) | ~(var > 0)] = np.nan
+            corr[rows, cols] = np.clip(rr, -1, 1)
+            corr[cols, rows] = corr[rows, cols].T
+    return corr
+
+
+def average_linkage(dist):
+    """Return the average-linkage hierarchical clustering of a distance matrix (as scipy.cluster.hierarchy.linkage)
+
+    Every row of the linkage merges two clusters (ids of the merged ones, distance, size), the cluster created by row
+    k has id n + k. The nearest neighbour of every cluster is cached, only the rows involving the merged clusters are
+    updated at every step
+    """
+    nn = len(dist)
+    dd = np.array(dist, dtype=np.float64)
+    np.fill_diagonal(dd, np.inf)
+    sizes = np.ones(nn)
+    ids = np.arange(nn)
+    active = np.ones(nn, dtype=bool)
+    neighbour = dd.argmin(axis=1) if nn > 1 else np.zeros(nn, dtype=np.int64)
+    neighbour_dist = dd[np.arange(nn), neighbour]
+    linkage = np.empty((max(nn - 1, 0), 4))
+    for kk in range(nn - 1):
+        aa = int(neighbour_dist.argmin())
+        aa, bb = sorted((aa, int(neighbour[aa])))
+        linkage[kk] = [min(ids[aa], ids[bb]), max(ids[aa], ids[bb]), neighbour_dist[aa], sizes[aa] + sizes[bb]]
+        # Lance-Williams update, the merged cluster takes the place of aa
+        merged = (sizes[aa] * dd[aa] + sizes[bb] * dd[bb]) / (sizes[aa] + sizes[bb])
+        merged[~active] = np.inf
+        merged[[aa, bb]] = np.inf
+        dd[aa], dd[:, aa] = merged, merged
+        dd[bb], dd[:, bb] = np.inf, np.inf
+        sizes[aa] += sizes[bb]
+        ids[aa] = nn + kk
+        active[bb] = False
+        neighbour_dist[bb] = np.inf
+        stale = np.flatnonzero(active & ((neighbour == aa) | (neighbour == bb)))
+        if len(stale):
+            neighbour[stale] = dd[stale].argmin(axis=1)
+            neighbour_dist[stale] = dd[stale, neighbour[stale]]
+        closer = active & (merged < neighbour_dist)
+        neighbour[closer], neighbour_dist[closer] = aa, merged[closer]
+    return linkage
+
+
+def leaf_order(linkage):
+    """Return the order of the leaves of a linkage (left to right in the dendrogram)"""
+    nn = len(linkage) + 1
+    order = []
+    stack = [2 * nn - 2] if len(linkage) else [0]
+    while stack:
+        node = stack.pop()
+        if node < nn:
+            order.append(node)
+        else:
+            left, right = linkage[node - nn, :2].astype(int)
+            stack += [right, left]
+    return order
+
+
+def get_order(values, method=None, corr=None):
+    """Return the order of the columns of values from the hierarchical clustering of their correlations
+
+    The correlation matrix of the columns can be given (as stored by step 4), it's computed otherwise. Linkages are
+    cached in ANALYSIS_DIR (the least recently used beyond ANALYSIS_CACHE_SIZE are removed), a table already
+    clustered with the same settings is ordered instantly
+    """
+    method = method or defs.CORRELATION_METHOD
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    if values.shape[1] < 3:
+        return list(range(values.shape[1]))
+    if corr is None:
+        sha = hashlib.sha256(f'{values.shape} {method} {defs.CORRELATION_MIN_PERIODS}'.encode())
+        sha.update(values.tobytes())
+    else:
+        corr = np.ascontiguousarray(corr, dtype=np.float64)
+        sha = hashlib.sha256(f'{corr.shape} correlation'.encode())
+        sha.update(corr.tobytes())
+    cache_dir = Path(defs.ANALYSIS_DIR)
+    path = cache_dir / f'linkage_{sha.hexdigest()[:20]}.npy'
+    if path.exists():
+        path.touch()
+        return leaf_order(np.load(path))
+    if corr is None:
+        corr = correlation(values, method, defs.CORRELATION_MIN_PERIODS, defs.CORRELATION_BLOCK_SIZE)
+    # Pairs without enough pages in common are considered uncorrelated
+    linkage = average_linkage(1 - np.nan_to_num(corr, nan=0.0))
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    np.save(path, linkage)
+    cached = sorted(cache_dir.glob('linkage_*.npy'), key=lambda file: file.stat().st_mtime, reverse=True)
+    for file in cached[defs.ANALYSIS_CACHE_SIZE:]:
+        file.unlink(missing_ok=True)
+    return leaf_order(linkage)
+
+
+def get_stored_correlation(name, labels):
+    """Return the stored correlation matrix between languages/cuisines (name) ordered as labels
+
+    None if it hasn't been stored or if it doesn't cover every label (e.g. the table has been rebuilt since)
+    """
+    file = f'data/correlation_{name}'
+    if not exists(file):
+        return None
+    corr = load_from_file(file)
+    if not set(labels) <= set(corr.index):
+        return None
+    return corr.loc[list(labels), list(labels)].to_numpy()
+
+
+def step4_compute_correlations():
+    """Compute the correlations between languages and between cuisines of the filtered table"""
+    df = load_from_file('data/table_dataframe')
+    values = df.to_numpy()
+    for name, labels, corr_values in (('languages', df.columns, values), ('cuisines', df.index, values.T)):
+        corr = correlation(corr_values, defs.CORRELATION_METHOD, defs.CORRELATION_MIN_PERIODS,
+                           defs.CORRELATION_BLOCK_SIZE)
+        save_to_file(f'data/correlation_{name}', pd.DataFrame(corr, index=labels, columns=labels))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the pipeline (steps 1-5) on synthetic datasets served by a local MediaWiki stand-in
+
+Throughput (retrieved pages per second) and peak memory of every dataset are compared with a stored baseline,
+regressions beyond the tolerance are reported (exit code 1)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pandas as pd
+import platform
+import shutil
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import defs
+from fakewiki import SyntheticDataset, serve, get_urls
+
+# Synthetic datasets of increasing size (dense enough for the default step4 thresholds to keep a non-empty table)
+DATASETS = {
+    'small': {'n_cuisines': 50, 'n_languages': 40, 'density': 0.5},
+    'medium': {'n_cuisines': 200, 'n_languages': 120},
+    'large': {'n_cuisines': 800, 'n_languages': 300},
+}
+
+
+def run_pipeline(workdir, api_url, page_url, images):
+    """Run steps 1-5 in workdir (from scratch), return the instrumentation report, the total wall time and the shape
+    of the filtered table
+
+    Raise ValueError if step 4 filters out every cuisine or language (steps 4-5 would be benchmarked on nothing)
+    """
+    import main
+    from instrumentation import METRICS
+    from scheduler import Scheduler
+    from storage import load_from_file
+    from visualization import step5_create_plots
+
+    os.chdir(workdir)
+    defs.WIKI_API_URL, defs.WIKI_PAGE_URL = api_url, page_url
+    defs.CACHE_ENABLED = False
+    defs.SHOW_RESULTS = False
+    defs.STORE_IMAGE = images
+    start = time.perf_counter()
+    Scheduler(main.STEPS).run()
+    df = load_from_file('data/table_dataframe')
+    if df.empty:
+        raise ValueError(f"Empty filtered table {df.shape} (dataset too sparse for the step4 thresholds)")
+    with METRICS.step('step5_create_plots'):
+        step5_create_plots(df, load_from_file('data/table_dataframe_full'))
+    return METRICS.report(), time.perf_counter() - start, list(df.shape)
+
+
+def run_dataset(config, latency=0.0, images=False):
+    """Benchmark the pipeline on a synthetic dataset, run in a fresh process (memory isn't shared with other runs)"""
+    dataset = SyntheticDataset(**config)
+    server = serve(dataset, latency=latency)
+    try:
+        with TemporaryDirectory() as workdir:
+            shutil.copytree('data/lookup_jsons', Path(workdir) / 'data' / 'lookup_jsons')
+            (Path(workdir) / 'results').mkdir()
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                report, wall, table = executor.submit(run_pipeline, workdir, *get_urls(server.server_address[1]),
+                                                      images).result()
+    finally:
+        server.shutdown()
+    return {
+        'pages': dataset.n_pages(),
+        'table': table,
+        'wall': wall,
+        'throughput': dataset.n_pages() / wall,
+        'peak_rss': max(step['peak_rss'] for step in report['steps'].values()),
+        'steps': {
+            name: {key: step[key] for key in ('wall', 'cpu', 'peak_rss', 'requests')}
+            for name, step in report['steps'].items()
+        }
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of throughput and peak memory beyond the tolerance (fraction of the baseline)"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f} pages/s "
+                               f"(baseline {base['throughput']:.1f} pages/s)")
+        if result['peak_rss'] > base['peak_rss'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss'] / 1024**2:.0f} MB "
+                               f"(baseline {base['peak_rss'] / 1024**2:.0f} MB)")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--datasets', nargs='+', choices=DATASETS, default=[*DATASETS])
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every response of the stand-in")
+    parser.add_argument('--images', action='store_true', help="export images too (only HTML by default)")
+    parser.add_argument('--baseline', default='benchmarks/baseline.json')
+    parser.add_argument('--update-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="accepted regression (fraction of the baseline)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+    for name in args.datasets:
+        print(f"Benchmarking {name} dataset ({DATASETS[name]})...")
+        results[name] = run_dataset(DATASETS[name], args.latency, args.images)
+
+    df = pd.DataFrame.from_dict(results, orient='index')[['pages', 'table', 'wall', 'throughput', 'peak_rss']]
+    df['peak_rss'] = df['peak_rss'] / 1024**2
+    print(df.rename(columns={'wall': 'wall [s]', 'throughput': 'pages/s', 'peak_rss': 'peak RSS [MB]'}).round(2))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline.update(results)
+        baseline['machine'] = {'platform': platform.platform(), 'cpus': os.cpu_count(), 'latency': args.latency}
+        baseline_path.write_text(json.dumps(baseline, indent=2))
+        print(f"Baseline stored in {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"No baseline in {baseline_path} (store one with --update-baseline)")
+        return
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+    for regression in regressions:
+        print(f"[Regression] {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache of HTTP responses
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+
+import defs
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a response is not in the cache"""
+
+
+class ResponseCache:
+    """Content-addressed cache of response bodies, keyed by method, URL and parameters
+
+    Every entry is a file named after the key: its mtime is the time it was fetched (for the TTL),
+    its atime the last time it was used (for the LRU eviction once the cache grows over max_size)
+    """
+    def __init__(self, path=None, ttl=None, max_size=None, offline=None):
+        self.path = Path(path or defs.CACHE_DIR)
+        self.ttl = defs.CACHE_TTL if ttl is None else ttl
+        self.max_size = defs.CACHE_MAX_SIZE if max_size is None else max_size
+        self.offline = defs.OFFLINE if offline is None else offline
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self._entries())
+        self._lock = threading.Lock()
+
+    def _entries(self):
+        for subdir in os.scandir(self.path):
+            if subdir.is_dir():
+                yield from (entry for entry in os.scandir(subdir) if entry.is_file())
+
+    @staticmethod
+    def key(method, url, params=None):
+        """Return the key identifying a call"""
+        call = json.dumps([method.upper(), url, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(call.encode()).hexdigest()
+
+    def _file(self, key):
+        return self.path / key[:2] / key
+
+    def get(self, key, name=None):
+        """Return the cached body (None if missing or expired), raise CacheMiss in offline mode"""
+        file = self._file(key)
+        try:
+            stat = file.stat()
+        except FileNotFoundError:
+            stat = None
+        # In offline mode expired entries are still served
+        if stat and (self.offline or not self.ttl or time.time() - stat.st_mtime < self.ttl):
+            os.utime(file, (time.time(), stat.st_mtime))
+            return file.read_bytes()
+        if self.offline:
+            raise CacheMiss(f"Response not cached in offline mode: {name or key}")
+        return None
+
+    def put(self, key, content):
+        """Store a body, evicting the least recently used entries if the cache is full"""
+        file = self._file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = file.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp_file.write_bytes(content)
+        # The cache is shared by every engine and thread of the process
+        with self._lock:
+            previous_size = file.stat().st_size if file.exists() else 0
+            os.replace(tmp_file, file)
+            self.size += len(content) - previous_size
+            if self.max_size and self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is below max_size"""
+        entries = sorted(((entry.stat().st_atime, entry.stat().st_size, entry.path) for entry in self._entries()))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            os.remove(path)
+            self.size -= size
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache():
+    """Return the response cache configured in defs (None if disabled)
+
+    One cache is created for every configuration and reused, so that the directory is scanned only once
+    """
+    if not (defs.CACHE_ENABLED or defs.OFFLINE):
+        return None
+    key = (Path(defs.CACHE_DIR).resolve(), defs.CACHE_TTL, defs.CACHE_MAX_SIZE, defs.OFFLINE)
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = ResponseCache()
+        return _CACHES[key]
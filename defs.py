@@ -4,10 +4,67 @@
 Constants/settings definition
 """
 
+# Topics to analyze, taken from the links in a navbox template (in the list following the anchor link, if any),
+# from the pages in a category or from a list of titles ('template'/'category'/'titles')
+TOPIC_SOURCE = 'template'
+TOPIC_TEMPLATE = 'Template:Cuisines'
+TOPIC_TEMPLATE_ANCHOR = 'National dish'
+TOPIC_CATEGORY = 'Category:National cuisines'
+TOPIC_TITLES = []
+# Removed from the topics titles in tables and plots
+TOPIC_SUFFIX = ' cuisine'
+
 # Thresholds for processing and data creation
 THRESHOLD_MIN_CUISINES = 14
 THRESHOLD_MIN_LANGUAGES = 13
 THRESHOLD_MIN_VOICE_LENGTH = 4000
+# Processes evaluating the combinations of thresholds (sweep command)
+SWEEP_WORKERS = 4
+
+# Fetching
+WIKI_API_URL = 'https://{}/w/api.php'
+WIKI_PAGE_URL = 'https://{}/wiki/{}'
+FETCH_MAX_CONCURRENCY = 32
+FETCH_MAX_PER_HOST = 4
+# Per-host concurrency starts at FETCH_INITIAL_PER_HOST and adapts up to FETCH_MAX_PER_HOST (AIMD on latency/errors)
+FETCH_INITIAL_PER_HOST = 2
+FETCH_LATENCY_FACTOR = 3.0
+FETCH_DECREASE_FACTOR = 0.5
+# Throttled (429/503/maxlag) and failed calls are retried with jittered exponential backoff (seconds)
+FETCH_MAX_RETRIES = 5
+FETCH_BACKOFF_BASE = 1.0
+FETCH_BACKOFF_MAX = 60.0
+# Seconds of database replication lag above which MediaWiki refuses API calls (maxlag parameter)
+FETCH_MAXLAG = 5
+
+# Source of langlinks and page info: 'api' (live API) or 'dumps' (SQL dumps stored in DUMPS_DIR, no network access)
+DATA_SOURCE = 'api'
+DUMPS_DIR = 'data/dumps'
+DUMP_FILE = '{wiki}-latest-{table}.sql.gz'
+DUMPS_WORKERS = 4
+
+# Refresh: only the pages changed since the last retrieval of a wiki are requested again (recentchanges keeps the
+# changes for a limited time, every page of the wiki is requested if the last retrieval is older)
+REFRESH_MAX_AGE_DAYS = 30
+
+# History: page lengths at HISTORY_SNAPSHOTS dates, one every HISTORY_FREQUENCY (pandas offset alias, 'MS' for month
+# starts) up to HISTORY_END ('YYYY-MM-DD', today if None), stored as the changes between snapshots in HISTORY_FILE.
+# Playing the snapshots shows each one for HISTORY_FRAME_DURATION milliseconds
+HISTORY_SNAPSHOTS = 12
+HISTORY_FREQUENCY = 'MS'
+HISTORY_END = None
+HISTORY_FILE = 'data/history.npz'
+HISTORY_FRAME_DURATION = 500
+
+# Report of the run (time, requests, bytes, cache hits and memory per step and per host)
+REPORT_FILE = 'results/run_report.json'
+
+# Response cache (OFFLINE serves every call from the cache, failing on a miss)
+CACHE_ENABLED = True
+CACHE_DIR = 'data/cache'
+CACHE_TTL = 7 * 24 * 3600
+CACHE_MAX_SIZE = 512 * 1024**2
+OFFLINE = False
 
 # Enabled graphs
 PRODUCE_FULL_HEATMAP = True
@@ -23,6 +80,25 @@ MARKER_ON_DIAGONAL_CELLS = True
 TEXT_SIZE_AXIS_TITLE = 16
 TEXT_SIZE_LABELS = 14
 
+# Heatmap axes order: 'alphabetical' or 'clustering' (cuisines and languages ordered by average-linkage hierarchical
+# clustering on 1 - correlation, the last ANALYSIS_CACHE_SIZE linkages cached in ANALYSIS_DIR)
+HEATMAP_ORDER = 'clustering'
+# Correlations between languages and between cuisines: 'pearson' (on log page lengths) or 'spearman', computed on the
+# pages available for both (NaN with less than CORRELATION_MIN_PERIODS), blocks of CORRELATION_BLOCK_SIZE variables
+CORRELATION_METHOD = 'pearson'
+CORRELATION_MIN_PERIODS = 3
+CORRELATION_BLOCK_SIZE = 512
+ANALYSIS_DIR = 'data/analysis'
+ANALYSIS_CACHE_SIZE = 16
+
+# Large heatmaps: WebGL rendering, summary tiles as first view (tiles are groups of cuisines/languages if given as
+# {label: group}, blocks of HEATMAP_TILE_SIZE otherwise)
+HEATMAP_WEBGL_MIN_CELLS = 100000
+HEATMAP_LOD_MIN_CELLS = 20000
+HEATMAP_TILE_SIZE = 10
+HEATMAP_CUISINES_GROUPS = {}
+HEATMAP_LANGUAGES_GROUPS = {}
+
 # Heatmap color palettes
 # yapf: disable
 HEATMAP_COLORSCALE_GREEN = [[0,   "rgb(178, 233, 201)"],
@@ -49,5 +125,18 @@ DEMONYMS_EXCEPTIONS = {'Bosnia and Herzegovina': 'Bosnian', 'Kazakh': 'Kazakhsta
 # Image production
 SHOW_RESULTS = True
 STORE_HTML = True
+HTML_COMPACT = True
 STORE_IMAGE = True
-STORE_STATISTICS = True
\ No newline at end of file
+STORE_STATISTICS = True
+IMAGE_FORMATS = ['jpg']
+IMAGE_WIDTH = 1920
+IMAGE_HEIGHT = 1080
+IMAGE_SCALE = 2.0
+EXPORT_WORKERS = 4
+
+# Statistics: the STATISTICS_TOP_CUISINES cuisines with the longest pages overall and the STATISTICS_TOP_VOICES
+# longest pages (at most STATISTICS_VOICES_PER_CUISINE of a cuisine), stored as 'md', 'csv' and/or 'json'
+STATISTICS_TOP_CUISINES = 30
+STATISTICS_TOP_VOICES = 10
+STATISTICS_VOICES_PER_CUISINE = 3
+STATISTICS_FORMATS = ['md']
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Ingestion of Wikimedia SQL dumps (page, langlinks), alternative to the API with no network access
+
+Dumps (e.g. itwiki-latest-page.sql.gz from https://dumps.wikimedia.org) are stored in DUMPS_DIR. They are streamed
+line by line (every INSERT statement holds a bounded batch of rows), keeping only the rows of the requested pages.
+Dumps of different wikis are parsed in parallel processes
+"""
+import gzip
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+import defs
+
+# Wikis whose database name isn't derived from their subdomain
+DBNAME_EXCEPTIONS = {'be-tarask': 'be_x_old'}
+
+COLUMN_RE = re.compile(r"^\s+`(\w+)`")
+ROW_RE = re.compile(r"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)")
+FIELD_RE = re.compile(r"'((?:[^'\\]|\\.)*)'|([^,]+)")
+ESCAPE_RE = re.compile(r"\\(.)")
+ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+
+def get_dbname(wiki_url):
+    """Return the database name of a xyz.wikipedia.org host (e.g. zh-min-nan.wikipedia.org -> zh_min_nanwiki)"""
+    subdomain = wiki_url.split('.')[0]
+    return f"{DBNAME_EXCEPTIONS.get(subdomain, subdomain.replace('-', '_'))}wiki"
+
+
+def get_dump_file(wiki_url, table):
+    """Return the path of the dump of a table of a wiki"""
+    return Path(defs.DUMPS_DIR) / defs.DUMP_FILE.format(wiki=get_dbname(wiki_url), table=table)
+
+
+def _parse_field(quoted, raw):
+    if raw:
+        raw = raw.strip()
+        return None if raw == 'NULL' else raw
+    return ESCAPE_RE.sub(lambda match: ESCAPES.get(match.group(1), match.group(1)), quoted)
+
+
+def iter_rows(file, columns):
+    """Yield the values (strings, None for NULL) of the given columns for every row of a table dump"""
+    table_columns = []
+    indexes = None
+    with gzip.open(file, 'rt', encoding='utf-8', errors='replace') as fp:
+        for line in fp:
+            if indexes is None:
+                # Columns order is taken from the CREATE TABLE statement preceding the data
+                if (match := COLUMN_RE.match(line)):
+                    table_columns.append(match.group(1))
+                elif line.startswith('INSERT INTO'):
+                    indexes = [table_columns.index(column) for column in columns]
+            if indexes is not None and line.startswith('INSERT INTO'):
+                for row in ROW_RE.finditer(line):
+                    fields = [_parse_field(*field) for field in FIELD_RE.findall(row.group(1))]
+                    yield tuple(fields[idx] for idx in indexes)
+
+
+def format_timestamp(ts):
+    """Return a MediaWiki timestamp (20230412093011) in the API format (2023-04-12T09:30:11Z)"""
+    return f'{ts[:4]}-{ts[4:6]}-{ts[6:8]}T{ts[8:10]}:{ts[10:12]}:{ts[12:14]}Z'
+
+
+def scan_pages(wiki_url, titles=None, pageids=None):
+    """Return the info of the given articles (by title or pageid) from the page dump, keyed as requested
+
+    Info are the ones of the API (length, lastrevid, touched, title, pageid). Redirects aren't followed
+    """
+    file = get_dump_file(wiki_url, 'page')
+    if not file.exists():
+        print(f"[Skip] {wiki_url} (missing dump {file})")
+        return {}
+    wanted_titles = {title.replace(' ', '_'): title for title in titles or []}
+    wanted_pageids = {str(pageid) for pageid in pageids or []}
+    pages = {}
+    columns = ('page_id', 'page_namespace', 'page_title', 'page_is_redirect', 'page_latest', 'page_len', 'page_touched')
+    for pageid, namespace, title, redirect, latest, length, touched in iter_rows(file, columns):
+        if namespace != '0' or (title not in wanted_titles and pageid not in wanted_pageids):
+            continue
+        page = {'pageid': int(pageid), 'title': title.replace('_', ' ')}
+        if redirect == '0':
+            page.update({'length': int(length), 'lastrevid': int(latest), 'touched': format_timestamp(touched)})
+        pages[wanted_titles[title] if title in wanted_titles else pageid] = page
+    return pages
+
+
+def scan_langlinks(wiki_url, pageids):
+    """Return the interlanguage links of the given pages from the langlinks dump (as listed by the API), by pageid"""
+    file = get_dump_file(wiki_url, 'langlinks')
+    if not file.exists():
+        print(f"[Skip] {wiki_url} (missing dump {file})")
+        return {}
+    wanted_pageids = {str(pageid) for pageid in pageids}
+    langlinks = {}
+    for pageid, lang, title in iter_rows(file, ('ll_from', 'll_lang', 'll_title')):
+        if pageid in wanted_pageids and title:
+            url = f"https://{lang}.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}"
+            langlinks.setdefault(pageid, []).append({'lang': lang, '*': title, 'url': url})
+    return langlinks
+
+
+def get_pageids_info(wiki_url, pageids):
+    """Return info and interlanguage links of the given pages, keyed by pageid (as wikiapi.get_pageids_info)"""
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        pages = executor.submit(scan_pages, wiki_url, pageids=pageids)
+        langlinks = executor.submit(scan_langlinks, wiki_url, pageids)
+        pages, langlinks = pages.result(), langlinks.result()
+    for pageid, page in pages.items():
+        if pageid in langlinks:
+            page['langlinks'] = langlinks[pageid]
+    return pages
+
+
+def get_wikis_pages_info(wikis_titles):
+    """Return the info of the given titles of every wiki ({wiki_url: titles}), keyed by wiki and title"""
+    with ProcessPoolExecutor(max_workers=defs.DUMPS_WORKERS) as executor:
+        futures = {wiki_url: executor.submit(scan_pages, wiki_url, titles) for wiki_url, titles in wikis_titles.items()}
+        return {wiki_url: future.result() for wiki_url, future in futures.items()}
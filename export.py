@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Export of figures to results (images/html)
+"""
+import base64
+import hashlib
+import json
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from plotly.offline import get_plotlyjs
+
+import defs
+
+PLOTLYJS_FILE = 'plotly.min.js'
+
+
+def _start_renderer():
+    """Start the Kaleido renderer of the worker once, it's then kept warm for all the exports of the worker"""
+    pio.to_image(go.Figure(), format='png', width=10, height=10)
+
+
+# Decode arrays stored as {dtype, bdata, shape} into typed arrays (rows of a 2D array are views on the same buffer)
+DECODE_ARRAYS_JS = """
+function decodeArrays(obj) {
+    if (Array.isArray(obj)) return obj.map(decodeArrays);
+    if (obj === null || typeof obj !== 'object') return obj;
+    if (obj.bdata !== undefined && obj.dtype !== undefined) {
+        var bin = atob(obj.bdata), bytes = new Uint8Array(bin.length);
+        for (var i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+        var arr = obj.dtype === 'f4' ? new Float32Array(bytes.buffer) : new Float64Array(bytes.buffer);
+        if (!obj.shape || obj.shape.length < 2) return arr;
+        var rows = [];
+        for (var r = 0; r < obj.shape[0]; r++) rows.push(arr.subarray(r * obj.shape[1], (r + 1) * obj.shape[1]));
+        return rows;
+    }
+    var out = {};
+    for (var key in obj) out[key] = decodeArrays(obj[key]);
+    return out;
+}
+"""
+
+# Level-of-detail heatmaps (layout.meta.lod): zooming on the summary tiles (or the Detail button) loads the detail
+# heatmap from its script (lod.detail_file, compact HTML) the first time, then shows it. Resetting the zoom (autorange)
+# goes back to the summary. Hover labels of the detail (lod.detail_labels) are built from the axes ticks of every cell
+LOD_JS = """
+function loadLevelOfDetail(gd, lod, done) {
+    if (gd._lodLoaded) return done();
+    var update = {};
+    var show = function () {
+        gd._lodLoaded = true;
+        if (lod.detail_labels) {
+            var xt = lod.detail_layout['xaxis.ticktext'], yt = lod.detail_layout['yaxis.ticktext'];
+            update.customdata = [yt.map(function (y) { return xt.map(function (x) { return [y, x]; }); })];
+        }
+        Plotly.restyle(gd, update, [0]).then(done);
+    };
+    if (!lod.detail_file) return show();
+    var script = document.createElement('script');
+    script.src = lod.detail_file;
+    script.onload = function () {
+        var detail = decodeArrays(window.lodDetail[gd.id]);
+        // Snapshots shown before the detail was loaded already set its values
+        if (!gd.data[0].z) update.z = [detail.z];
+        show();
+    };
+    document.head.appendChild(script);
+}
+function setupLevelOfDetail(gd) {
+    var lod = gd.layout.meta && gd.layout.meta.lod;
+    if (!lod) return;
+    gd.on('plotly_relayout', function (ev) {
+        var detail = gd.data[gd.data.length - 1].visible === false;
+        if (!detail && (ev['xaxis.range[0]'] !== undefined || ev['yaxis.range[0]'] !== undefined)) {
+            loadLevelOfDetail(gd, lod, function () {
+                Plotly.update(gd, {visible: lod.detail_visible}, lod.detail_layout);
+            });
+        } else if (detail && (ev['xaxis.autorange'] || ev['yaxis.autorange'])) {
+            Plotly.update(gd, {visible: lod.summary_visible}, lod.summary_layout);
+        }
+    });
+    gd.on('plotly_buttonclicked', function (ev) {
+        if (ev.button.label === 'Detail') loadLevelOfDetail(gd, lod, function () {});
+    });
+}
+"""
+
+# Script run once plotted by the pages written by plotly (non-compact HTML, plot command)
+LOD_POST_SCRIPT = LOD_JS + "setupLevelOfDetail(document.getElementById('{plot_id}'));"
+
+LOD_DETAIL_JS = """window.lodDetail = window.lodDetail || {{}};
+window.lodDetail['{div_id}'] = {detail_json};
+"""
+
+COMPACT_HTML_TEMPLATE = """<html>
+<head><meta charset="utf-8" /></head>
+<body>
+    <div id="{div_id}" class="plotly-graph-div" style="height:100%; width:100%;"></div>
+    <script src="{plotlyjs}"></script>
+    <script type="text/javascript">{decoder}{lod}
+        var fig = decodeArrays({fig_json});
+        Plotly.newPlot('{div_id}', {{data: fig.data, layout: fig.layout, frames: fig.frames || [],
+                                     config: {{responsive: true}}}}).then(setupLevelOfDetail);
+    </script>
+</body>
+</html>
+"""
+
+
+def encode_array(values):
+    """Return a numeric (1D/2D) array as base64 typed array, float32 if no precision is lost (None if not numeric)"""
+    try:
+        arr = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if arr.ndim not in (1, 2):
+        return None
+    arr_f4 = arr.astype(np.float32)
+    if np.array_equal(arr_f4.astype(np.float64), arr, equal_nan=True):
+        arr, dtype = arr_f4, 'f4'
+    else:
+        dtype = 'f8'
+    return {'dtype': dtype, 'bdata': base64.b64encode(np.ascontiguousarray(arr).tobytes()).decode(), 'shape': arr.shape}
+
+
+def split_detail(fig, div_id):
+    """Move the values of the detail heatmap of a level-of-detail figure (first trace) to a script loaded on demand
+
+    Return the script (None if the figure isn't a level-of-detail heatmap)
+    """
+    lod = fig['layout'].get('meta', {}).get('lod') if isinstance(fig['layout'].get('meta'), dict) else None
+    if not lod:
+        return None
+    detail = fig['data'][0]
+    lod['detail_file'] = f'{div_id}.detail.js'
+    values = {'z': encode_array(detail['z']) or detail['z']}
+    detail['z'] = None
+    return LOD_DETAIL_JS.format(div_id=div_id, detail_json=json.dumps(values, separators=(',', ':')))
+
+
+def to_compact_html(fig_json, div_id, plotlyjs=PLOTLYJS_FILE):
+    """Return an HTML page loading the shared plotly.js bundle, with numeric trace arrays stored as typed arrays
+
+    The detail of level-of-detail heatmaps is returned as a separate script (None for other figures)
+    """
+    fig = json.loads(fig_json)
+    detail_js = split_detail(fig, div_id)
+    for trace in fig['data'] + [trace for frame in fig.get('frames', []) for trace in frame['data']]:
+        for kk, vv in trace.items():
+            if isinstance(vv, list) and len(vv) >= 16 and (encoded := encode_array(vv)) is not None:
+                trace[kk] = encoded
+        if isinstance(trace.get('marker', {}).get('color'), list):
+            if (encoded := encode_array(trace['marker']['color'])) is not None:
+                trace['marker']['color'] = encoded
+    fig_json = json.dumps(fig, separators=(',', ':'), ensure_ascii=False)
+    return COMPACT_HTML_TEMPLATE.format(div_id=div_id,
+                                        plotlyjs=plotlyjs,
+                                        decoder=DECODE_ARRAYS_JS,
+                                        lod=LOD_JS,
+                                        fig_json=fig_json), detail_js
+
+
+def write_plotlyjs(directory):
+    """Write the plotly.js bundle shared by the compact HTML pages (if missing or of a different version)"""
+    plotlyjs = get_plotlyjs()
+    file = Path(directory) / PLOTLYJS_FILE
+    if not file.exists() or file.stat().st_size != len(plotlyjs.encode()):
+        file.write_text(plotlyjs)
+
+
+def _export(fig_json, fmt, file, options):
+    """Write a figure (JSON spec) to file in the given format"""
+    if fmt == 'html' and options['compact']:
+        html, detail_js = to_compact_html(fig_json, Path(file).stem)
+        with open(file, 'w+') as fp:
+            fp.write(html)
+        if detail_js:
+            with open(Path(file).with_suffix('.detail.js'), 'w+') as fp:
+                fp.write(detail_js)
+        return file
+    fig = pio.from_json(fig_json)
+    if fmt == 'html':
+        with open(file, 'w+') as fp:
+            fp.write(fig.to_html(post_script=LOD_POST_SCRIPT))
+    else:
+        with open(file, 'wb+') as fp:
+            fp.write(fig.to_image(format=fmt, width=options['width'], height=options['height'], scale=options['scale']))
+    return file
+
+
+def get_export_specs(fig, formats):
+    """Return the JSON spec to export for every format"""
+    specs = {}
+    for fmt in formats:
+        if fmt == 'html':
+            specs[fmt] = fig.to_json()
+        else:
+            # WebGL gains nothing in static images and is rendered in software by Kaleido (much slower)
+            data = [
+                go.Heatmap(trace.to_plotly_json()) if isinstance(trace, go.Heatmapgl) else trace for trace in fig.data
+            ]
+            # Remove axes titles for image
+            fig_image = go.Figure(data=data, layout=fig.layout)
+            fig_image.update_layout(xaxis={'title': {'text': ''}}, yaxis={'title': {'text': ''}})
+            # Images of level-of-detail heatmaps show the detail, not the summary tiles
+            meta = fig_image.layout.meta
+            lod = meta.get('lod') if isinstance(meta, dict) else None
+            if lod:
+                for trace, visible in zip(fig_image.data, lod['detail_visible']):
+                    trace.visible = visible
+                fig_image.update_layout(lod['detail_layout'])
+                fig_image.layout.updatemenus = ()
+            # Images of heatmaps with snapshots show the last one (frames aren't exported)
+            if fig.frames:
+                fig_image.layout.sliders = ()
+                fig_image.layout.updatemenus = ()
+            specs[fmt] = fig_image.to_json()
+    return specs
+
+
+def export_figures(figures, formats, directory='results', manifest_file='results/.export_manifest.json'):
+    """Write all figures in all formats concurrently, skipping the ones unchanged since the last export"""
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(manifest_file)
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    jobs = {}
+    for fig_name, fig in figures.items():
+        for fmt, spec in get_export_specs(fig, formats).items():
+            file = Path(directory) / f'{fig_name}.{fmt}'
+            if fmt == 'html':
+                size = 'compact' if defs.HTML_COMPACT else ''
+            else:
+                size = f'{defs.IMAGE_WIDTH}x{defs.IMAGE_HEIGHT}@{defs.IMAGE_SCALE}'
+            spec_hash = hashlib.sha256(f'{fmt}{size}{spec}'.encode()).hexdigest()
+            if file.exists() and manifest.get(file.name) == spec_hash:
+                print(f"[Skip] {file} (unchanged)")
+                continue
+            jobs[file] = (spec, fmt, spec_hash)
+    if 'html' in formats and defs.HTML_COMPACT:
+        write_plotlyjs(directory)
+    if not jobs:
+        return
+    needs_renderer = any(fmt != 'html' for _, fmt, _ in jobs.values())
+    with ProcessPoolExecutor(max_workers=min(defs.EXPORT_WORKERS, len(jobs)),
+                             initializer=_start_renderer if needs_renderer else None) as executor:
+        options = {
+            'width': defs.IMAGE_WIDTH,
+            'height': defs.IMAGE_HEIGHT,
+            'scale': defs.IMAGE_SCALE,
+            'compact': defs.HTML_COMPACT
+        }
+        futures = {file: executor.submit(_export, spec, fmt, file, options) for file, (spec, fmt, _) in jobs.items()}
+        try:
+            for file, future in futures.items():
+                future.result()
+                manifest[file.name] = jobs[file][2]
+                print(f"Exported {file}")
+        finally:
+            manifest_path.write_text(json.dumps(manifest, indent=2))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in of the MediaWiki API and pages, serving a synthetic dataset of cuisines (for benchmarks)
+
+Every path starts with the host it stands for: /en.wikipedia.org/wiki/Template:Cuisines, /it.wikipedia.org/w/api.php.
+The pipeline is pointed to it through WIKI_API_URL and WIKI_PAGE_URL
+"""
+import argparse
+import json
+import numpy as np
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote
+
+# Revisions per response of a prop=revisions query, langlinks per response of a prop=langlinks query (as lllimit=max),
+# changes per response of a list=recentchanges query (as rclimit=max)
+REVISIONS_PER_RESPONSE = 5
+LANGLINKS_PER_RESPONSE = 500
+RECENT_CHANGES_PER_RESPONSE = 500
+
+
+class SyntheticDataset:
+    """Cuisines (from the demonyms lookup) with a page in a random subset of languages (reproducible from the seed)
+
+    If aliases, some langlinks point to titles to normalize (underscores) or to redirects of the pages
+    """
+    def __init__(self, n_cuisines, n_languages, density=0.3, seed=0, lookups_dir='data/lookup_jsons', aliases=False):
+        with open(Path(lookups_dir) / 'lookup_countries_demonyms.json', 'r') as fp:
+            demonyms = [*json.load(fp)[0]]
+        with open(Path(lookups_dir) / 'lookup_countries_languages.json', 'r') as fp:
+            language_names = sorted(set(json.load(fp)[0].values()))
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.cuisines = [f"{demonyms[idx % len(demonyms)]}{'' if idx < len(demonyms) else idx} cuisine"
+                         for idx in range(n_cuisines)]
+        self.languages = [(f"l{idx:03d}", f"{language_names[idx % len(language_names)]}"
+                           f"{'' if idx < len(language_names) else f' {idx}'}") for idx in range(n_languages)]
+        self.present = rng.random((n_cuisines, n_languages)) < density
+        self.lengths = np.rint(rng.lognormal(9, 1, (n_cuisines, n_languages))).astype(int)
+        self.revisions = rng.integers(1, 10**9, (n_cuisines, n_languages))
+        self.rows = {cuisine: idx for idx, cuisine in enumerate(self.cuisines)}
+        self.hosts = {f"{code}.wikipedia.org": idx for idx, (code, _) in enumerate(self.languages)}
+        self.aliases = aliases
+        self.titles = {}
+        self.redirects = {}
+        for col, (code, _) in enumerate(self.languages):
+            for row in np.flatnonzero(self.present[:, col]):
+                self.titles[(col, self.get_title(row, col))] = row
+                if aliases and (row + col) % 5 == 1:
+                    self.redirects[(col, self.get_link_title(row, col))] = self.get_title(row, col)
+
+    def get_history(self, row, col, length, start='2023-01-01', end='2026-01-01'):
+        """Return (timestamp, size) of the revisions of a page from the newest, the last one being length long"""
+        rng = np.random.default_rng([self.seed, row, col + 1])
+        n_revisions = 1 + rng.poisson(8)
+        seconds = np.sort(rng.integers(np.datetime64(start, 's').astype(int), np.datetime64(end, 's').astype(int),
+                                       n_revisions))[::-1]
+        sizes = np.rint(length * np.linspace(1, rng.random(), n_revisions)).astype(int)
+        return [(f"{np.datetime64(int(sec), 's')}Z", int(size)) for sec, size in zip(seconds, sizes)]
+
+    def get_title(self, row, col):
+        return f"{self.cuisines[row]} ({self.languages[col][0]})"
+
+    def get_link_title(self, row, col):
+        """Return the title the langlink of a page points to"""
+        title = self.get_title(row, col)
+        if self.aliases and (row + col) % 5 == 0:
+            return title.replace(' ', '_')
+        if self.aliases and (row + col) % 5 == 1:
+            return f"{title} (redirect)"
+        return title
+
+    def n_pages(self):
+        """Number of (cuisine, language) pages, English excluded"""
+        return int(self.present.sum())
+
+
+class Throttle:
+    """Throttling of the first API calls: 429/503 status or MediaWiki maxlag error (200 status), with Retry-After"""
+    def __init__(self, kind='429', calls=0, retry_after=0):
+        if kind not in ('429', '503', 'maxlag'):
+            raise ValueError(f"Undefined throttling: {kind}")
+        self.kind = kind
+        self.calls = calls
+        self.retry_after = retry_after
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Check if the next call is throttled"""
+        with self._lock:
+            if self.throttled >= self.calls:
+                return False
+            self.throttled += 1
+            return True
+
+
+class FakeWikiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, content, content_type='application/json', status=200, headers=None):
+        time.sleep(self.server.latency)
+        data = content.encode()
+        self.send_response(status)
+        for kk, vv in (headers or {}).items():
+            self.send_header(kk, vv)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        title = unquote(self.path).partition('/wiki/')[2]
+        dataset = self.server.dataset
+        if title == 'Template:Cuisines':
+            items = ''.join(f'<li><a href="/wiki/{quote(cuisine.replace(" ", "_"))}">{cuisine}</a></li>'
+                            for cuisine in dataset.cuisines)
+            self._send(f'<html><body><div class="navbox"><a title="National dish">National dish</a>'
+                       f'<ul>{items}</ul></div></body></html>', 'text/html')
+        elif title == 'Table_of_Wikimedia_projects':
+            rows = ''.join(f'<tr><td>{code}</td><td>{name}</td><td>{name}</td></tr>'
+                           for code, name in dataset.languages)
+            self._send(f'<html><body><table class="sortable"><tr><th>Code</th></tr>{rows}</table></body></html>',
+                       'text/html')
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        host = self.path.lstrip('/').split('/')[0]
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        params = {kk: vv[0] for kk, vv in parse_qs(body).items()}
+        self.server.calls.append((host, params))
+        throttle = self.server.throttle
+        if throttle and throttle.take():
+            headers = {'Retry-After': str(throttle.retry_after)}
+            if throttle.kind == 'maxlag':
+                error = {'error': {'code': 'maxlag', 'info': 'Waiting for a database server', 'lag': 6}}
+                self._send(json.dumps(error), headers={**headers, 'MediaWiki-API-Error': 'maxlag'})
+            else:
+                self._send('{}', status=int(throttle.kind), headers=headers)
+            return
+        dataset = self.server.dataset
+        if params.get('list') == 'recentchanges':
+            # Newest first, back to rcend
+            changes = sorted(((ts, title) for change_host, ts, title in self.server.recent_changes
+                              if change_host == host and ts >= params.get('rcend', '')), reverse=True)
+            offset = int(params.get('rccontinue', 0))
+            recentchanges = [{'type': 'edit', 'ns': 0, 'title': title, 'timestamp': ts}
+                             for ts, title in changes[offset:offset + RECENT_CHANGES_PER_RESPONSE]]
+            res = {'batchcomplete': '', 'query': {'recentchanges': recentchanges}}
+            if offset + RECENT_CHANGES_PER_RESPONSE < len(changes):
+                res['continue'] = {'rccontinue': str(offset + RECENT_CHANGES_PER_RESPONSE), 'continue': '-||'}
+            self._send(json.dumps(res))
+            return
+        pages, normalized, redirects, continues = {}, [], [], {}
+        if 'pageids' in params:
+            links = []
+            for pageid in params['pageids'].split('|'):
+                row = int(pageid) - 1
+                pages[pageid] = {'pageid': int(pageid), 'ns': 0, 'title': dataset.cuisines[row], 'length': 50000,
+                                 'lastrevid': 1, 'touched': '2020-01-01T00:00:00Z'}
+                links += [(pageid, {
+                    'lang': code,
+                    'url': f"https://{code}.wikipedia.org/wiki/{quote(dataset.get_link_title(row, col))}",
+                    '*': dataset.get_link_title(row, col)
+                }) for col, (code, _) in enumerate(dataset.languages) if dataset.present[row, col]]
+            if 'langlinks' in params.get('prop', ''):
+                # LANGLINKS_PER_RESPONSE langlinks of the whole batch per response, every page info in each of them
+                offset = int(params.get('llcontinue', 0))
+                for pageid, link in links[offset:offset + LANGLINKS_PER_RESPONSE]:
+                    pages[pageid].setdefault('langlinks', []).append(link)
+                if offset + LANGLINKS_PER_RESPONSE < len(links):
+                    continues = {'llcontinue': str(offset + LANGLINKS_PER_RESPONSE), 'continue': '||'}
+        else:
+            col = dataset.hosts.get(host)
+            for idx, title in enumerate(params['titles'].split('|')):
+                if '_' in title:
+                    normalized.append({'from': title, 'to': title.replace('_', ' ')})
+                    title = title.replace('_', ' ')
+                if params.get('redirects') and (col, title) in dataset.redirects:
+                    redirects.append({'from': title, 'to': dataset.redirects[(col, title)]})
+                    title = dataset.redirects[(col, title)]
+                if host == 'en.wikipedia.org' and title in dataset.rows:
+                    row = dataset.rows[title]
+                    pages[str(row + 1)] = {'pageid': row + 1, 'ns': 0, 'title': title, 'length': 50000}
+                elif (row := dataset.titles.get((col, title))) is not None:
+                    pages[str(idx)] = {
+                        'pageid': idx, 'ns': 0, 'title': title,
+                        'length': int(dataset.lengths[row, col]),
+                        'lastrevid': int(dataset.revisions[row, col]),
+                        'touched': '2020-01-01T00:00:00Z'
+                    }
+                else:
+                    pages[str(-idx - 1)] = {'ns': 0, 'title': title, 'missing': ''}
+        res = {'batchcomplete': '', 'query': {'normalized': normalized, 'redirects': redirects, 'pages': pages}}
+        if continues:
+            res['continue'] = continues
+        if params.get('prop') == 'revisions':
+            # Single page, REVISIONS_PER_RESPONSE revisions (newest first) per response
+            for page in pages.values():
+                if 'missing' in page:
+                    continue
+                if host == 'en.wikipedia.org':
+                    history = dataset.get_history(dataset.rows[page['title']], -1, page.pop('length'))
+                else:
+                    history = dataset.get_history(dataset.titles[(col, page['title'])], col, page.pop('length'))
+                history = [(ts, size) for ts, size in history if ts <= params.get('rvstart', ts)]
+                offset = int(params.get('rvcontinue', 0))
+                page['revisions'] = [{'timestamp': ts, 'size': size}
+                                     for ts, size in history[offset:offset + REVISIONS_PER_RESPONSE]]
+                if offset + REVISIONS_PER_RESPONSE < len(history):
+                    res['continue'] = {'rvcontinue': str(offset + REVISIONS_PER_RESPONSE), 'continue': '||'}
+        self._send(json.dumps(res))
+
+
+def serve(dataset, port=0, latency=0.0, throttle=None):
+    """Start serving the dataset in a background thread, return the server (server_address has the actual port)
+
+    API calls are throttled as configured by throttle (a Throttle, None to never throttle)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeWikiHandler)
+    server.dataset = dataset
+    server.latency = latency
+    server.throttle = throttle
+    # (host, params) of every API call
+    server.calls = []
+    # (host, timestamp, title) of the changes listed by recentchanges (the dataset is edited by the caller)
+    server.recent_changes = []
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_urls(port):
+    """Return WIKI_API_URL and WIKI_PAGE_URL pointing to the stand-in listening on the given port"""
+    return f'http://127.0.0.1:{port}/{{}}/w/api.php', f'http://127.0.0.1:{port}/{{}}/wiki/{{}}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cuisines', type=int, default=100)
+    parser.add_argument('--languages', type=int, default=50)
+    parser.add_argument('--density', type=float, default=0.3)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--throttle', type=int, default=0, help="number of API calls throttled first")
+    parser.add_argument('--throttle-kind', choices=['429', '503', 'maxlag'], default='429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After of the throttled calls")
+    args = parser.parse_args()
+    serve(SyntheticDataset(args.cuisines, args.languages, args.density), args.port, args.latency,
+          Throttle(args.throttle_kind, args.throttle, args.retry_after))
+    print(f"Serving on port {args.port} (WIKI_API_URL, WIKI_PAGE_URL = {get_urls(args.port)})")
+    threading.Event().wait()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Concurrent HTTP fetching engine
+"""
+import asyncio
+import json
+import requests
+import threading
+import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib.parse import urlparse
+
+import defs
+
+from cache import get_cache
+from governor import GOVERNOR, is_throttled, parse_retry_after, backoff_delay
+from instrumentation import METRICS
+
+
+class FetchEngine:
+    """Run HTTP calls concurrently, capping the calls in flight globally and for every host (request governor)
+
+    Every host gets its own keep-alive session, calls are run by a thread pool and awaited from asyncio.
+    Successful responses go through the response cache (if enabled, cache=False bypasses it)
+    """
+    def __init__(self, max_concurrency=None, max_per_host=None, cache=None):
+        self.max_concurrency = max_concurrency or defs.FETCH_MAX_CONCURRENCY
+        self.max_per_host = max_per_host or defs.FETCH_MAX_PER_HOST
+        self.cache = get_cache() if cache is None else cache or None
+        self.sessions = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        # Global limit of every event loop using the engine (asyncio primitives are bound to a loop)
+        self._global_limits = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close all the sessions and stop the worker threads"""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self._executor.shutdown(wait=True)
+
+    def get_session(self, host):
+        """Return the pooled session used for every call to the given host"""
+        with self._lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def get_global_limit(self):
+        """Return the limit of the calls in flight of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._global_limits:
+                self._global_limits[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._global_limits[loop]
+
+    def _request(self, host, method, url, params):
+        return self.get_session(host).request(method, url, data=params if method == 'POST' else None,
+                                              params=params if method == 'GET' else None)
+
+    async def request(self, host, method, url, params=None):
+        """Perform a call once both the global and the host limits allow it, return the response
+
+        Throttled calls (the whole host is paused for Retry-After) and failed ones are retried with jittered
+        exponential backoff. The last response is returned (the exception raised) once retries are exhausted
+        """
+        loop = asyncio.get_running_loop()
+        governor = GOVERNOR.get(host, self.max_per_host)
+        for attempt in range(defs.FETCH_MAX_RETRIES + 1):
+            last_attempt = attempt == defs.FETCH_MAX_RETRIES
+            await governor.acquire()
+            res, start = None, time.monotonic()
+            try:
+                async with self.get_global_limit():
+                    start = time.monotonic()
+                    res = await loop.run_in_executor(self._executor, self._request, host, method, url, params)
+            except requests.RequestException as exc:
+                METRICS.record_request(host, request_time=time.monotonic() - start, retry=attempt > 0, failed=True)
+                if last_attempt:
+                    raise
+                reason, delay = exc.__class__.__name__, backoff_delay(attempt)
+            finally:
+                # The slot is freed whatever happened (cancellation included)
+                if res is None:
+                    governor.release(failed=True)
+            if res is not None:
+                throttled, failed = is_throttled(res), res.status_code >= 500
+                latency = time.monotonic() - start
+                governor.release(latency, throttled, failed)
+                METRICS.record_request(host, len(res.content), latency, retry=attempt > 0, failed=throttled or failed)
+                if not (throttled or failed) or last_attempt:
+                    return res
+                retry_after = parse_retry_after(res.headers.get('Retry-After'))
+                reason = res.headers.get('MediaWiki-API-Error', res.status_code)
+                delay = backoff_delay(attempt, retry_after)
+                if throttled:
+                    governor.pause(delay)
+            print(f"[Retry] {url} in {delay:.1f}s ({reason})")
+            await asyncio.sleep(delay)
+
+    async def post(self, host, url, params=None):
+        """Perform a POST call, return the decoded JSON (None if the call failed)"""
+        key = self.cache.key('POST', url, params) if self.cache else None
+        if self.cache and (content := self.cache.get(key, f'POST {url} {params}')) is not None:
+            METRICS.record_request(host, len(content), cached=True)
+            return json.loads(content)
+        try:
+            post = await self.request(host, 'POST', url, params)
+        except requests.RequestException as exc:
+            print(f"Issue in POST call ({exc})")
+            print(f"{url}\n{params}")
+            return None
+        if not post.ok or is_throttled(post):
+            print("Issue in POST call")
+            print(f"{url}\n{params}")
+            return None
+        if self.cache:
+            self.cache.put(key, post.content)
+        return post.json()
+
+    def run(self, coro):
+        """Run the coroutine to completion in a new event loop"""
+        return asyncio.run(coro)
+
+
+async def gather_with_progress(aws):
+    """Await all the awaitables concurrently showing a progress bar, return their results in order"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+        await fut
+    return [task.result() for task in tasks]
+
+
+_TEXT_ENGINE = None
+_TEXT_ENGINE_LOCK = threading.Lock()
+
+
+def get_text_engine():
+    """Return the engine of the single calls (created once, its sessions and threads are reused)"""
+    global _TEXT_ENGINE
+    with _TEXT_ENGINE_LOCK:
+        if _TEXT_ENGINE is None:
+            _TEXT_ENGINE = FetchEngine()
+        return _TEXT_ENGINE
+
+
+def fetch_text(url, params=None, method='GET', cache=None):
+    """Perform a single blocking call through the response cache and the request governor, return the response text"""
+    cache = cache or get_cache()
+    key = cache.key(method, url, params) if cache else None
+    if cache and (content := cache.get(key, f'{method} {url} {params or ""}')) is not None:
+        METRICS.record_request(urlparse(url).netloc, len(content), cached=True)
+        return content.decode()
+    engine = get_text_engine()
+    req = engine.run(engine.request(urlparse(url).netloc, method, url, params))
+    req.raise_for_status()
+    if cache:
+        cache.put(key, req.content)
+    return req.text
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Request governor: adaptive per-host concurrency, throttling and retries
+"""
+import asyncio
+import random
+import threading
+import time
+
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import defs
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class HostGovernor:
+    """Concurrency window of a host, tuned by AIMD, and pause requested by the host (Retry-After)
+
+    The window grows additively (+1 per window of successful calls) while the latency stays within
+    FETCH_LATENCY_FACTOR times the fastest observed, and shrinks multiplicatively on throttling, errors or slow calls.
+    Calls waiting for a slot are woken when one is freed (they can belong to the event loops of different threads)
+    """
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = float(min(defs.FETCH_INITIAL_PER_HOST, max_limit))
+        self.in_flight = 0
+        self.min_latency = None
+        self.paused_until = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, waiter=None):
+        """Take a slot of the window, return 0 if taken, the seconds of pause left or None if the window is full
+
+        If the window is full, the waiter ((loop, future)) is woken once a slot is freed
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= int(self.limit):
+                if waiter:
+                    self._waiters.append(waiter)
+                return None
+            self.in_flight += 1
+            return 0
+
+    async def acquire(self):
+        """Wait for a slot of the window"""
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.create_future()
+            wait = self.try_acquire((loop, future))
+            if wait == 0:
+                return
+            if wait is not None:
+                await asyncio.sleep(wait)
+                continue
+            try:
+                await future
+            except asyncio.CancelledError:
+                # The slot it may have been woken for goes to the next waiter
+                with self._lock:
+                    self._wake_waiters()
+                raise
+
+    def _wake_waiters(self):
+        """Wake as many waiters as free slots (the lock must be held)"""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            loop, future = self._waiters.popleft()
+            if future.done():
+                continue
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # Event loop already closed
+                continue
+            free -= 1
+
+    def release(self, latency=None, throttled=False, failed=False):
+        """Free a slot, adapting the window to the outcome of the call"""
+        with self._lock:
+            self.in_flight -= 1
+            if latency is not None and not (throttled or failed):
+                self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            if throttled or failed or (latency is not None and latency > defs.FETCH_LATENCY_FACTOR * self.min_latency):
+                self.limit = max(1.0, self.limit * defs.FETCH_DECREASE_FACTOR)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def pause(self, seconds):
+        """Stop every call to the host for the given seconds"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RequestGovernor:
+    """Governors of all the hosts, shared by every fetch engine (and thread) of the process"""
+    def __init__(self):
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, max_limit=None):
+        """Return the governor of a host"""
+        with self._lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostGovernor(max_limit or defs.FETCH_MAX_PER_HOST)
+            return self.hosts[host]
+
+
+def parse_retry_after(value):
+    """Return the seconds requested by a Retry-After header (seconds or HTTP date), None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(response):
+    """Check if the host asked to slow down (429/503 or MediaWiki maxlag error, which comes with a 200 status)"""
+    return response.status_code in (429, 503) or response.headers.get('MediaWiki-API-Error') == 'maxlag'
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Return the seconds to wait before retrying: Retry-After if given, else exponential backoff with full jitter"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, defs.FETCH_BACKOFF_BASE)
+    return random.uniform(0, min(defs.FETCH_BACKOFF_MAX, defs.FETCH_BACKOFF_BASE * 2**attempt))
+
+
+GOVERNOR = RequestGovernor()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+History of the pages lengths: lengths at a series of dates (snapshots), stored as a delta-encoded cube
+
+Revisions (timestamp and size) of every page back to the first date are retrieved, the length at a date being the size
+of the last revision before it (0 if the page didn't exist yet). The (cuisine, language, snapshot) cube is stored as
+the cells that changed since the previous snapshot (coordinates and difference), so it grows with the number of
+changes rather than with snapshots × cells
+"""
+import numpy as np
+import pandas as pd
+
+import defs
+
+from fetch import FetchEngine, gather_with_progress
+from journal import Journal
+from retrieval import journal_result
+from storage import iter_records, load_from_file, exists
+from visualization import create_heatmap
+from wikiapi import get_revisions
+
+# Key of the dates of the snapshots in the journal (pages are keyed wiki_url|title)
+JOURNAL_DATES_KEY = 'dates'
+
+
+def get_dates():
+    """Return the dates of the snapshots (ISO 8601, from the oldest)"""
+    end = pd.Timestamp(defs.HISTORY_END) if defs.HISTORY_END else pd.Timestamp.utcnow().tz_localize(None)
+    dates = pd.date_range(end=end.normalize(), periods=defs.HISTORY_SNAPSHOTS, freq=defs.HISTORY_FREQUENCY)
+    return [date.strftime('%Y-%m-%dT%H:%M:%SZ') for date in dates]
+
+
+def get_lengths_at(revisions, dates):
+    """Return the length of a page at every date, given its revisions sorted from the oldest"""
+    timestamps = np.array([rev['timestamp'] for rev in revisions], dtype=str)
+    sizes = np.array([0] + [rev.get('size', 0) for rev in revisions])
+    return sizes[np.searchsorted(timestamps, np.array(dates), side='right')].tolist()
+
+
+async def get_page_lengths(engine, wiki_url, title, dates):
+    """Return the length of a page at every date"""
+    return get_lengths_at(await get_revisions(engine, wiki_url, title, dates[-1], dates[0], strict=True), dates)
+
+
+def encode_deltas(cube):
+    """Return coordinates (row, col, snapshot) and difference of the cells changed since the previous snapshot"""
+    deltas = np.diff(cube, axis=2, prepend=0)
+    rows, cols, snapshots = np.nonzero(deltas)
+    return rows, cols, snapshots, deltas[rows, cols, snapshots]
+
+
+def decode_deltas(shape, rows, cols, snapshots, deltas):
+    """Return the cube of the lengths given the changes between snapshots"""
+    cube = np.zeros(shape, dtype=np.int64)
+    cube[rows, cols, snapshots] = deltas
+    return np.cumsum(cube, axis=2)
+
+
+def save_history(file, cube, row_labels, col_labels, dates):
+    """Store the cube of the lengths as changes between snapshots (coordinates with the smallest integer types)"""
+    rows, cols, snapshots, deltas = encode_deltas(cube)
+    np.savez_compressed(file,
+                        shape=np.array(cube.shape),
+                        rows=rows.astype(np.min_scalar_type(cube.shape[0])),
+                        cols=cols.astype(np.min_scalar_type(cube.shape[1])),
+                        snapshots=snapshots.astype(np.min_scalar_type(cube.shape[2])),
+                        deltas=deltas.astype(np.int32),
+                        row_labels=np.array(row_labels, dtype=str),
+                        col_labels=np.array(col_labels, dtype=str),
+                        dates=np.array(dates, dtype=str))
+
+
+def load_history(file):
+    """Return the cube of the lengths (cuisine, language, snapshot), its labels and the dates of the snapshots"""
+    with np.load(file) as data:
+        cube = decode_deltas(tuple(data['shape']), data['rows'], data['cols'], data['snapshots'], data['deltas'])
+        return cube, data['row_labels'].tolist(), data['col_labels'].tolist(), data['dates'].tolist()
+
+
+def step_history(resume=False):
+    """Retrieve the lengths of every page at the snapshot dates, store them as a delta-encoded cube
+
+    Every page is journaled as soon as its revisions arrive, after the dates of the snapshots. If resume, the pages
+    journaled by an interrupted run aren't requested again, unless the dates differ (other settings, or another day
+    with HISTORY_END = None): the journal is then discarded
+    """
+    dates = get_dates()
+    print(f"Getting the lengths of every page at {len(dates)} dates ({dates[0][:10]} to {dates[-1][:10]})...")
+    row_labels, languages, cells = [], set(), {}
+    for row, (kk, vv) in enumerate(iter_records('data/cuisines_langs')):
+        row_labels.append(kk.replace(defs.TOPIC_SUFFIX, ""))
+        for lang, page in vv['languages'].items():
+            languages.add(lang)
+            cells.setdefault(f"{page.get('wiki_url', 'en.wikipedia.org')}|{page['title']}", []).append((row, lang))
+    col_labels = sorted(languages)
+    col_index = {lang: col for col, lang in enumerate(col_labels)}
+
+    journal = Journal('data/history')
+    journaled = journal.replay() if resume else {}
+    if journaled and journaled.get(JOURNAL_DATES_KEY) != dates:
+        print(f"[Skip] Journal of other dates ({journaled.get(JOURNAL_DATES_KEY)}), not resumed")
+        resume, journaled = False, {}
+    with journal.open(resume), FetchEngine() as engine:
+        if JOURNAL_DATES_KEY not in journaled:
+            journal.append(JOURNAL_DATES_KEY, dates)
+        engine.run(
+            gather_with_progress([
+                journal_result(journal, key, get_page_lengths(engine, *key.split('|', 1), dates)) for key in cells
+                if key not in journaled
+            ]))
+    cube = np.zeros((len(row_labels), len(col_labels), len(dates)), dtype=np.int64)
+    for key, lengths in journal.replay().items():
+        for row, lang in cells.get(key, []):
+            cube[row, col_index[lang]] = lengths
+    save_history(defs.HISTORY_FILE, cube, row_labels, col_labels, dates)
+    journal.remove()
+
+
+def create_history_heatmap(cube, row_labels, col_labels, dates):
+    """Create the heatmap of the last snapshot, with a frame for every snapshot
+
+    Only the cuisines and languages of the filtered table are shown (if built), as pages shorter than
+    THRESHOLD_MIN_VOICE_LENGTH
+    """
+    rows, cols = np.arange(len(row_labels)), np.arange(len(col_labels))
+    if exists('data/table_dataframe'):
+        df_table = load_from_file('data/table_dataframe')
+        rows = np.flatnonzero(np.isin(row_labels, df_table.index.to_list()))
+        cols = np.flatnonzero(np.isin(col_labels, df_table.columns.to_list()))
+    lengths = cube[np.ix_(rows, cols)].astype(np.float64)
+    lengths[lengths < max(defs.THRESHOLD_MIN_VOICE_LENGTH, 1)] = np.nan
+    # Languages on the y axis
+    snapshots = {date[:10]: lengths[:, :, idx].T for idx, date in enumerate(dates)}
+    df = pd.DataFrame(lengths[:, :, -1].T,
+                      index=pd.Index([col_labels[col] for col in cols], name='Wikipedia language'),
+                      columns=pd.Index([row_labels[row] for row in rows], name='Cuisine'))
+    return create_heatmap(df, defs.X_ADD_FLAGS, defs.MARKER_ON_DIAGONAL_CELLS, snapshots=snapshots)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of a run: time, requests, bytes, cache hits and memory per step and per host
+"""
+import contextvars
+import json
+import psutil
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+
+# Step being run by the current thread (inherited by the asyncio tasks it starts)
+CURRENT_STEP = contextvars.ContextVar('current_step', default=None)
+
+# Seconds between two samples of the memory in use
+SAMPLE_INTERVAL = 0.1
+
+
+def _new_counters():
+    return {'requests': 0, 'cache_hits': 0, 'bytes': 0, 'retries': 0, 'errors': 0, 'request_time': 0.0}
+
+
+def _new_step_counters():
+    return {'wall': 0.0, 'cpu': 0.0, 'peak_rss': 0, **_new_counters()}
+
+
+class Metrics:
+    """Counters of the run, per step and per host (thread-safe)
+
+    CPU time includes the child processes and is the one of the whole process while the step runs (steps running in
+    parallel share it). Peak RSS (process and children) is sampled in a background thread while steps run
+    """
+    def __init__(self):
+        self.steps = {}
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self._process = psutil.Process()
+        self._active = set()
+        self._sampler = None
+
+    def _cpu_time(self):
+        times = self._process.cpu_times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def _rss(self):
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def _sample(self):
+        while True:
+            rss = self._rss()
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                for name in self._active:
+                    self.steps[name]['peak_rss'] = max(self.steps[name]['peak_rss'], rss)
+            time.sleep(SAMPLE_INTERVAL)
+
+    @contextmanager
+    def step(self, name):
+        """Measure the step run within the context, requests performed by its thread are counted for it"""
+        token = CURRENT_STEP.set(name)
+        with self._lock:
+            stats = self.steps.setdefault(name, _new_step_counters())
+            self._active.add(name)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        wall, cpu = time.perf_counter(), self._cpu_time()
+        try:
+            yield stats
+        finally:
+            rss = self._rss()
+            with self._lock:
+                stats['wall'] += time.perf_counter() - wall
+                stats['cpu'] += self._cpu_time() - cpu
+                stats['peak_rss'] = max(stats['peak_rss'], rss)
+                self._active.discard(name)
+            CURRENT_STEP.reset(token)
+
+    def record_request(self, host, nbytes=0, request_time=0.0, cached=False, retry=False, failed=False):
+        """Count a call (or a response served by the cache) for its host and the current step"""
+        step = CURRENT_STEP.get()
+        with self._lock:
+            counters = [self.hosts.setdefault(host, _new_counters())]
+            if step is not None:
+                counters.append(self.steps.setdefault(step, _new_step_counters()))
+            for counter in counters:
+                counter['requests'] += 1
+                counter['cache_hits'] += cached
+                counter['bytes'] += nbytes
+                counter['retries'] += retry
+                counter['errors'] += failed
+                counter['request_time'] += request_time
+
+    def report(self):
+        """Return all the counters"""
+        with self._lock:
+            return {'steps': json.loads(json.dumps(self.steps)), 'hosts': json.loads(json.dumps(self.hosts))}
+
+    def write_report(self, file):
+        """Write the counters as JSON"""
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        with open(file, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+
+    def print_summary(self, max_hosts=10):
+        """Print a table of the steps and one of the hosts where requests took longest"""
+        import pandas as pd
+
+        report = self.report()
+        if report['steps']:
+            df = pd.DataFrame.from_dict(report['steps'], orient='index')
+            df['MB'] = df.pop('bytes') / 1024**2
+            df['peak_rss'] = df['peak_rss'] / 1024**2
+            df = df.rename(columns={'peak_rss': 'peak RSS [MB]', 'wall': 'wall [s]', 'cpu': 'CPU [s]'})
+            print(df.drop(columns='request_time').round(2).to_string())
+        if report['hosts']:
+            df = pd.DataFrame.from_dict(report['hosts'], orient='index')
+            df['MB'] = df.pop('bytes') / 1024**2
+            df = df.rename(columns={'request_time': 'request time [s]'})
+            print(df.sort_values('request time [s]', ascending=False).head(max_hosts).round(2).to_string())
+
+
+METRICS = Metrics()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Journal of the partial results of a step, to resume it after a crash
+"""
+import json
+import os
+
+from pathlib import Path
+
+
+class Journal:
+    """Append-only JSON lines log of (key, result), every entry is flushed as soon as it's appended
+
+    Replaying the journal returns the results already logged, so that only the missing ones are requested again.
+    A truncated last entry (crash while writing) is ignored and overwritten
+    """
+    def __init__(self, file):
+        self.path = Path(f'{file}.journal.jsonl')
+        self._fp = None
+
+    def _read(self):
+        entries, size = {}, 0
+        if self.path.exists():
+            with open(self.path, 'rb') as fp:
+                for line in fp:
+                    try:
+                        key, value = json.loads(line)
+                    except ValueError:
+                        break
+                    entries[key] = value
+                    size += len(line)
+        return entries, size
+
+    def replay(self):
+        """Return the logged results, keyed as appended"""
+        return self._read()[0]
+
+    def open(self, resume=False):
+        """Open the journal for appending, keeping the logged results only if resume"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            _, size = self._read()
+            self._fp = open(self.path, 'ab')
+            self._fp.truncate(size)
+        else:
+            self._fp = open(self.path, 'wb')
+        return self
+
+    def append(self, key, value):
+        """Log a result"""
+        self._fp.write(json.dumps([key, value], ensure_ascii=False, separators=(',', ':')).encode() + b'\n')
+        self._fp.flush()
+
+    def close(self):
+        if self._fp is not None:
+            os.fsync(self._fp.fileno())
+            self._fp.close()
+            self._fp = None
+
+    def remove(self):
+        """Delete the journal, once the results are stored in the step output"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
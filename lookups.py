@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lookup registry for flags, language names and native languages
+"""
+import emoji
+import json
+
+from collections import Counter
+from functools import cached_property
+from pathlib import Path
+
+from storage import load_from_file
+
+
+class LookupRegistry:
+    """Lookups loaded lazily, every source is parsed once and kept as precomputed dicts
+
+    Hits and misses of every lookup are counted (misses fall back to the key itself)
+    """
+    def __init__(self, lookups_dir='data/lookup_jsons', wiki_languages='data/wiki_languages'):
+        self.lookups_dir = Path(lookups_dir)
+        self.wiki_languages = wiki_languages
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _load_json(self, name):
+        with open(self.lookups_dir / name, 'r') as fp:
+            return json.load(fp)[0]
+
+    @cached_property
+    def demonyms_countries(self):
+        """Demonym (adjective) to country"""
+        return self._load_json('lookup_countries_demonyms.json')
+
+    @cached_property
+    def countries_languages(self):
+        """Country to its (lowercase) language"""
+        return {kk: vv.lower() for kk, vv in self._load_json('lookup_countries_languages.json').items()}
+
+    @cached_property
+    def demonyms_flags(self):
+        """Demonym to flag emoji"""
+        flags = {}
+        for demonym, country in self.demonyms_countries.items():
+            country = country.replace(' ', '_').replace('Cuisine of ', '')
+            flag = emoji.emojize(f':{country}:', use_aliases=True)
+            if flag == f':{country}:':
+                flag = emoji.emojize(f':flag_for_{country}:', use_aliases=True)
+            flags[demonym] = flag
+        return flags
+
+    @cached_property
+    def demonyms_languages(self):
+        """Demonym to the (lowercase) language of the country"""
+        return {
+            demonym: self.countries_languages[country]
+            for demonym, country in self.demonyms_countries.items() if country in self.countries_languages
+        }
+
+    @cached_property
+    def languages_names(self):
+        """Wikipedia language prefix to English language name"""
+        return {kk: vv['eng_name'] for kk, vv in load_from_file(self.wiki_languages).items()}
+
+    def lookup(self, name, keys):
+        """Look up a list of keys in the given lookup, return the values (None for unknown keys)"""
+        table = getattr(self, name)
+        values = [table.get(key) for key in keys]
+        misses = sum(value is None for value in values)
+        self.hits[name] += len(values) - misses
+        self.misses[name] += misses
+        return values
+
+    def get_flags(self, demonyms):
+        """Return the flags of a list of demonyms (the demonym itself if unknown)"""
+        flags = []
+        for demonym, flag in zip(demonyms, self.lookup('demonyms_flags', demonyms)):
+            if flag is None:
+                print(f"Error getting flag for {demonym}")
+                flag = f"{demonym}"
+            flags.append(flag)
+        return flags
+
+    def get_languages_names(self, language_prefixes):
+        """Return the names of a list of language prefixes (the prefix itself if unknown)"""
+        return [
+            name if name is not None else f"{lang}"
+            for lang, name in zip(language_prefixes, self.lookup('languages_names', language_prefixes))
+        ]
+
+    def get_native_languages(self, demonyms):
+        """Return the languages of a list of demonyms (None if unknown)"""
+        languages = self.lookup('demonyms_languages', demonyms)
+        for demonym, language in zip(demonyms, languages):
+            if language is None:
+                print(f"Unknown key ({demonym})")
+        return languages
+
+    def report(self):
+        """Return hits and misses of every lookup used"""
+        return {name: {'hits': self.hits[name], 'misses': self.misses[name]} for name in self.hits}
+
+
+LOOKUPS = LookupRegistry()
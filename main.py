@@ -2,233 +2,272 @@
 # -*- coding: utf-8 -*-
 """
 Script to create an heatmap between Wikipedia cuisines pages
-"""
-
-import pandas as pd
-import numpy as np
-import requests
 
-from bs4 import BeautifulSoup
-from pathlib import Path
-from urllib.parse import unquote
-from tqdm import tqdm
+Commands: fetch (steps 1-3), build-table (step 4), sweep (of the step 4 thresholds), plot (show the graphs),
+stats, export (store the graphs), history (lengths at past dates) and run (fetch to export, the default). Every
+command imports only the modules it uses, settings in defs.py can be overridden with --set KEY=VALUE
+"""
+import argparse
+import ast
+import sys
 
 import defs
-from utils import strip_url, save_to_file, load_from_file, execute_steps, split_to_chunks
-from visualization import step5_create_plots
-
-
-def step1_prepare_cuisines_data():
-    """Create a data structure starting from the cuisines list in Template:Cuisines"""
-    req = requests.get('https://en.wikipedia.org/wiki/Template:Cuisines')
-    soup = BeautifulSoup(req.text, features='html.parser')
-    html_cuisines = soup.find(title='National dish').find_next('ul')
-    cuisines_titles = []
-    skipped = []
-    for ch in html_cuisines:
-        if not isinstance(ch, str):
-            if len(ch.find_all('a')) > 1:
-                # If it has sub-cuisines (regional ones) consider only the first
-                cuisine = ch.find_all('a')[0]
-            else:
-                # If it's only a national cuisine
-                cuisine = ch.find('a')
-            # If it's not a redirect to a different page (e.g.: "cuisine" section in the country page)
-            if not cuisine.get('class'):
-                title, href = cuisine.get('title'), cuisine.get('href')
-                cuisines_titles.append((title, unquote(href.replace('/wiki/', ''))))
-            elif 'mw-redirect' in cuisine.get('class'):
-                skipped.append(cuisine.get('title'))
-            else:
-                raise ValueError(f"Undefined case: {cuisine}")
-    if skipped:
-        for skip in skipped:
-            print(f"[Skip] {skip} (redirect)")
-
-    api_url = 'https://en.wikipedia.org/w/api.php'
-    params = {'action': 'query', 'format': 'json'}
-    cuisines_raw = {}
-    for chunk in split_to_chunks(cuisines_titles, 50):
-        params['titles'] = f"{'|'.join([c[1] for c in chunk])}"
-        with requests.Session() as session:
-            post = session.post(api_url, params)
-            res = post.json()
-        for vv in res['query']['pages'].values():
-            cuisines_raw[vv['title']] = {'pageid': str(vv['pageid']), 'languages': {}}
-    save_to_file('data/cuisines_raw.dat', cuisines_raw)
-
-
-def step2_populate_other_languages():
-    """Gets URLs and titles of cuisines in multiple languages"""
-    cuisines_raw = load_from_file('data/cuisines_raw.dat')
-
-    wiki_url = 'https://en.wikipedia.org/w/api.php'
-    params = {'action': 'query', 'prop': 'langlinks|info', 'llprop': 'url', 'lllimit': 'max', 'format': 'json'}
-    print("Getting links for every cuisine for every language...")
-    for vv in tqdm(cuisines_raw.values()):
-        pageid = vv['pageid']
-        params['pageids'] = pageid
-        with requests.Session() as session:
-            post = session.post(wiki_url, params)
-            res = post.json()
-            res_info = res['query']['pages'][pageid]
-        if 'langlinks' in res_info:
-            vv['languages'] = {
-                vv['lang']: {
-                    'title': vv['*'],
-                    'wiki_url': strip_url(vv['url'])
-                }
-                for vv in res_info['langlinks']
-            }
-            vv['languages']['en'] = {}
-            vv['languages']['en']['length'] = res_info['length']
-            vv['languages']['en']['title'] = res['query']['pages'][pageid]['title']
-    save_to_file('data/cuisines_langs.dat', cuisines_raw)
-
-
-def step3_fill_lengths():
-    """Retrieve the lengths of the pages via APIs"""
-    cuisines = load_from_file('data/cuisines_langs.dat')
-
-    # TODO: refactor grouping together pages, do only one request for every xyz.wikipedia.org
-    params = {'action': 'query', 'prop': 'info', 'format': 'json'}
-    skipped = []
-    for kk, vv in tqdm(cuisines.items()):
-        for lang_prefix, page in tqdm(vv['languages'].items()):
-            if lang_prefix != 'en':
-                wiki_url = page['wiki_url']
-                api_url = f'https://{wiki_url}/w/api.php'
-                params['titles'] = page['title']
-                with requests.Session() as session:
-                    post = session.post(api_url, params)
-                    if post.ok:
-                        res = post.json()
-                    else:
-                        print("Issue in POST call")
-                        print(f"{api_url}\n{params}")
-                page_data = res['query']['pages'][next(iter(res['query']['pages']))]
-                if 'length' in page_data:
-                    vv['languages'][lang_prefix]['length'] = page_data['length']
-                else:
-                    skipped.append((kk, lang_prefix))
-    if skipped:
-        for page, lang in skipped:
-            print(f"[Skip] {page} in language {lang} (unavailable length)")
-    save_to_file('data/cuisines_length.dat', cuisines)
-
-
-def step4_preprocess_data_frame(create_full_df=False):
-    """Create pandas DataFrames filtering out undesired data"""
-    cuisines = load_from_file('data/cuisines_length.dat')
-
-    # Set values (depending if dataframe/dataframe_full is to create)
-    if create_full_df:
-        threshold_min_voice_length = 0
-        threshold_min_cuisines = 0
-        threshold_min_languages = 0
-        filename = 'data/table_dataframe_full.dat'
-    else:
-        threshold_min_voice_length = defs.THRESHOLD_MIN_VOICE_LENGTH
-        threshold_min_cuisines = defs.THRESHOLD_MIN_CUISINES
-        threshold_min_languages = defs.THRESHOLD_MIN_LANGUAGES
-        filename = 'data/table_dataframe.dat'
-
-    # Set pandas view options
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.max_columns', None)
-    pd.set_option('display.width', None)
-    pd.set_option('display.max_colwidth', None)
-
-    # Find languages to consider
-    languages = set()
-    for kk, vv in cuisines.items():
-        for lang in [*vv['languages'].keys()]:
-            languages.add(lang)
-    languages = [*languages]
-    languages.sort()
-    languages.insert(0, 'cuisine')
-
-    # Create full table
-    df_fulltable = pd.DataFrame(columns=languages)
-    for kk, vv in tqdm(cuisines.items()):
-        entry = {}
-        for kk2, vv2 in vv['languages'].items():
-            if 'length' in vv2 and kk2 in languages:
-                entry[kk2] = vv2['length']
-            # Add cuisine name (removing "cuisine")
-            entry['Cuisine'] = kk.replace(" cuisine", "")
-        df_fulltable = df_fulltable.append(entry, ignore_index=True)
-
-    short_voices = []
-    for (c_name, c_data) in df_fulltable.iteritems():
-        if c_name != 'Cuisine':
-            for entry in c_data.iteritems():
-                if not pd.isna(entry[1]) and int(entry[1]) < threshold_min_voice_length:
-                    short_voices.append((c_name, entry[0], entry[1]))
-
-    for entry in short_voices:
-        df_fulltable.at[entry[1], entry[0]] = np.nan
-
-    # TODO:Fix: depending on the order different results are obtained
-    # Keep all languages that have least THRESHOLD_MIN_CUISINES written
-    df_fulltable.dropna(axis=1, thresh=threshold_min_cuisines, inplace=True)
-    # Keep all cuisines that appears in at least THRESHOLD_MIN_LANGUAGES languages
-    df_fulltable = df_fulltable[df_fulltable.isnull().sum(axis=1) < len(df_fulltable.columns) - threshold_min_languages]
-
-    df_fulltable.reset_index(drop=True, inplace=True)
-    df_fulltable.set_index('Cuisine', inplace=True)
-    df_fulltable.columns.names = ['Wikipedia language']
-
-    save_to_file(filename, df_fulltable)
-
+from scheduler import Step, Scheduler
 
 # yapf: disable
-STEPS = [step1_prepare_cuisines_data,
-         step2_populate_other_languages,
-         step3_fill_lengths,
-         step4_preprocess_data_frame]
+FETCH_STEPS = [Step('retrieval.step1_prepare_cuisines_data',
+                    outputs=['data/cuisines_raw'],
+                    config=['WIKI_API_URL', 'WIKI_PAGE_URL', 'TOPIC_SOURCE', 'TOPIC_TEMPLATE', 'TOPIC_TEMPLATE_ANCHOR',
+                            'TOPIC_CATEGORY', 'TOPIC_TITLES']),
+               Step('retrieval.step2_populate_other_languages',
+                    inputs=['data/cuisines_raw'],
+                    outputs=['data/cuisines_langs'],
+                    config=['WIKI_API_URL', 'DATA_SOURCE']),
+               Step('retrieval.step3_fill_lengths',
+                    inputs=['data/cuisines_langs'],
+                    outputs=['data/cuisines_length'],
+                    config=['WIKI_API_URL', 'DATA_SOURCE'],
+                    kwargs={'incremental': True}),
+               Step('retrieval.get_wikimedia_languages_list',
+                    outputs=['data/wiki_languages'],
+                    config=['WIKI_PAGE_URL'])]
+TABLE_STEPS = [Step('preprocessing.step4_preprocess_data_frame',
+                    inputs=['data/cuisines_length'],
+                    outputs=['data/table_dataframe'],
+                    config=['THRESHOLD_MIN_VOICE_LENGTH', 'THRESHOLD_MIN_CUISINES', 'THRESHOLD_MIN_LANGUAGES',
+                            'TOPIC_SUFFIX']),
+               Step('analysis.step4_compute_correlations',
+                    inputs=['data/table_dataframe'],
+                    outputs=['data/correlation_languages', 'data/correlation_cuisines'],
+                    config=['CORRELATION_METHOD', 'CORRELATION_MIN_PERIODS']),
+               Step('preprocessing.step4_preprocess_data_frame',
+                    name='step4_preprocess_data_frame_full',
+                    inputs=['data/cuisines_length'],
+                    outputs=['data/table_dataframe_full'],
+                    config=['TOPIC_SUFFIX'],
+                    kwargs={'create_full_df': True})]
+STEPS = FETCH_STEPS + TABLE_STEPS
 # yapf: enable
 
-
-def get_wikimedia_languages_list():
-    """Download and create a correlation dict from language prefixes to long language names"""
-    wiki_languages = {}
-    req = requests.get('https://meta.wikimedia.org/wiki/Table_of_Wikimedia_projects')
-    soup = BeautifulSoup(req.text, features='html.parser')
-    table = soup.find_all('table', class_='sortable')[0]
-    for tr in table.find_all('tr'):
-        tds = tr.find_all('td')
-        if not tds:
-            continue
-        code, english_name, local_name = [td.text.strip() for td in tds[:3]]
-        code = code.replace(':', '')
-        wiki_languages[code] = {'eng_name': english_name, 'local_name': local_name}
-    save_to_file('data/wiki_languages.dat', wiki_languages)
-
-
-def main():
-    if not Path('data/cuisines_raw.dat').exists():
-        execute_steps(STEPS, [i for i in range(0, len(STEPS))])
-    elif not Path('data/cuisines_langs.dat').exists():
-        execute_steps(STEPS, [i for i in range(1, len(STEPS))])
-    elif not Path('data/cuisines_length.dat').exists():
-        execute_steps(STEPS, [i for i in range(2, len(STEPS))])
-    elif not Path('data/table_dataframe.dat').exists():
-        execute_steps(STEPS, [i for i in range(3, len(STEPS))])
-    if not Path('data/table_dataframe_full.dat').exists():
-        step4_preprocess_data_frame(create_full_df=True)
-    if not Path('data/wiki_languages.dat').exists():
-        get_wikimedia_languages_list()
-
-    cc1 = load_from_file('data/cuisines_raw.dat')
-    cc2 = load_from_file('data/cuisines_langs.dat')
-    cc3 = load_from_file('data/cuisines_length.dat')
-    wl = load_from_file('data/wiki_languages.dat')
-    df = load_from_file('data/table_dataframe.dat')
-    df_full = load_from_file('data/table_dataframe_full.dat')
+TABLES = ('data/table_dataframe', 'data/table_dataframe_full')
+
+
+def parse_setting(text):
+    """Return (key, value) of a KEY=VALUE override of defs.py (the value is a Python literal or a string)"""
+    key, _, value = text.partition('=')
+    if not key.isupper() or not hasattr(defs, key):
+        raise argparse.ArgumentTypeError(f"Unknown setting: {key}")
+    try:
+        return key, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return key, value
+
+
+def run_steps(steps, args):
+    """Run the steps that are not up to date (only print them with --explain), return whether they were run"""
+    if getattr(args, 'offline', False):
+        defs.OFFLINE = True
+    if getattr(args, 'dumps', False):
+        defs.DATA_SOURCE = 'dumps'
+    if getattr(args, 'cache_ttl', None) is not None:
+        defs.CACHE_TTL = args.cache_ttl
+
+    scheduler = Scheduler(steps)
+    if getattr(args, 'resume', False):
+        for name in ('step2_populate_other_languages', 'step3_fill_lengths'):
+            scheduler.steps[name].kwargs['resume'] = True
+    force = []
+    if getattr(args, 'refresh', False):
+        # Langlinks and revisions must be checked against the live API
+        defs.CACHE_ENABLED = False
+        force = ['step2_populate_other_languages', 'step3_fill_lengths']
+    if args.explain:
+        scheduler.explain(force)
+        return False
+    scheduler.run(force)
+    return True
+
+
+def load_tables(files=TABLES):
+    """Load the tables built by step 4 (exit if they haven't been built yet)"""
+    from storage import exists, load_from_file
+
+    missing = [file for file in files if not exists(file)]
+    if missing:
+        print(f"Missing {', '.join(missing)} (run the fetch and build-table commands first)")
+        sys.exit(1)
+    return [load_from_file(file) for file in files]
+
+
+def print_reports(metrics=True):
+    """Print the lookups misses and the run report (stored in REPORT_FILE)"""
+    from lookups import LOOKUPS
+
+    # Unknown keys in the lookups (flags, language names) are shown as they are in the plots
+    for name, counts in LOOKUPS.report().items():
+        print(f"Lookup {name}: {counts['hits']} hits, {counts['misses']} misses")
+    if metrics:
+        from instrumentation import METRICS
+
+        METRICS.write_report(defs.REPORT_FILE)
+        METRICS.print_summary()
+
+
+def command_run(args):
+    if not run_steps(STEPS, args):
+        return
+    from instrumentation import METRICS
+    from visualization import step5_create_plots
 
     # Plot dataframe
-    step5_create_plots(df, df_full)
+    with METRICS.step('step5_create_plots'):
+        step5_create_plots(*load_tables())
+    print_reports()
+
+
+def command_fetch(args):
+    if run_steps(FETCH_STEPS, args):
+        print_reports()
+
+
+def command_build_table(args):
+    if run_steps(TABLE_STEPS, args):
+        print_reports()
+
+
+def command_sweep(args):
+    from storage import exists
+    from sweep import SWEEP_RESULTS_FILE, store_sweep
+
+    if not exists('data/cuisines_length'):
+        print("Missing data/cuisines_length (run the fetch command first)")
+        sys.exit(1)
+    store_sweep(args.min_length or [defs.THRESHOLD_MIN_VOICE_LENGTH],
+                args.min_cuisines or [defs.THRESHOLD_MIN_CUISINES],
+                args.min_languages or [defs.THRESHOLD_MIN_LANGUAGES],
+                args.store_tables,
+                args.workers,
+                args.output or SWEEP_RESULTS_FILE)
+
+
+def command_plot(args):
+    from export import LOD_POST_SCRIPT
+    from visualization import create_figures
+
+    for fig in create_figures(*load_tables()).values():
+        fig.show(post_script=LOD_POST_SCRIPT)
+    print_reports(metrics=False)
+
+
+def command_stats(args):
+    from stats import store_statistics
+
+    if args.formats:
+        defs.STATISTICS_FORMATS = args.formats
+    df_full, = load_tables(TABLES[1:])
+    store_statistics(df_full.drop(['cuisine'], axis=1, errors='ignore'))
+    print_reports(metrics=False)
+
+
+def command_export(args):
+    from export import export_figures
+    from visualization import create_figures
+
+    formats = args.formats or (['html'] if defs.STORE_HTML else []) + (defs.IMAGE_FORMATS if defs.STORE_IMAGE else [])
+    export_figures(create_figures(*load_tables()), formats)
+    print_reports(metrics=False)
+
+
+def command_history(args):
+    from export import export_figures
+    from history import step_history, load_history, create_history_heatmap
+    from instrumentation import METRICS
+    from storage import exists
+
+    if getattr(args, 'offline', False):
+        defs.OFFLINE = True
+    if not args.plot_only:
+        if not exists('data/cuisines_langs'):
+            print("Missing data/cuisines_langs (run the fetch command first)")
+            sys.exit(1)
+        with METRICS.step('step_history'):
+            step_history(args.resume)
+    formats = (['html'] if defs.STORE_HTML else []) + (defs.IMAGE_FORMATS if defs.STORE_IMAGE else [])
+    export_figures({'correlation_heatmap_history': create_history_heatmap(*load_history(defs.HISTORY_FILE))}, formats)
+    print_reports(metrics=not args.plot_only)
+
+
+COMMANDS = {
+    'run': command_run,
+    'fetch': command_fetch,
+    'build-table': command_build_table,
+    'sweep': command_sweep,
+    'plot': command_plot,
+    'stats': command_stats,
+    'export': command_export,
+    'history': command_history
+}
+
+
+def parse_args(argv):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--set',
+                        type=parse_setting,
+                        action='append',
+                        default=[],
+                        metavar='KEY=VALUE',
+                        help="override a setting of defs.py (Python literal or string), can be repeated")
+    fetching = argparse.ArgumentParser(add_help=False)
+    fetching.add_argument('--offline',
+                          action='store_true',
+                          help="serve every call from the response cache, failing on a miss (no network access)")
+    fetching.add_argument('--refresh',
+                          action='store_true',
+                          help="refresh the retrieved data: langlinks of every cuisine are requested again, page info "
+                          "only of the pages changed since the last run (of every page of a wiki whose changes can't "
+                          "be listed)")
+    fetching.add_argument('--resume',
+                          action='store_true',
+                          help="resume interrupted retrievals from their journal, requesting only the missing pages")
+    fetching.add_argument('--dumps',
+                          action='store_true',
+                          help="read langlinks and page info from the SQL dumps in DUMPS_DIR instead of the API")
+    fetching.add_argument('--cache-ttl', type=int, help="seconds after which cached responses are fetched again")
+    explain = argparse.ArgumentParser(add_help=False)
+    explain.add_argument('--explain', action='store_true', help="print which steps would run and why, then exit")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.add_parser('run', parents=[common, fetching, explain], help="all the steps, then plots and statistics")
+    commands.add_parser('fetch', parents=[common, fetching, explain], help="retrieve the pages data (steps 1-3)")
+    commands.add_parser('build-table', parents=[common, explain], help="build the tables to plot (step 4)")
+    sweep = commands.add_parser('sweep', parents=[common], help="shape and coverage of the table for every thresholds")
+    sweep.add_argument('--min-length', type=int, nargs='+', help="THRESHOLD_MIN_VOICE_LENGTH by default")
+    sweep.add_argument('--min-cuisines', type=int, nargs='+', help="THRESHOLD_MIN_CUISINES by default")
+    sweep.add_argument('--min-languages', type=int, nargs='+', help="THRESHOLD_MIN_LANGUAGES by default")
+    sweep.add_argument('--store-tables', action='store_true', help="store the filtered tables in data/sweep/")
+    sweep.add_argument('--output', help="results with the retained labels (results/threshold_sweep.json by default)")
+    sweep.add_argument('--workers', type=int, help="worker processes (SWEEP_WORKERS by default)")
+    commands.add_parser('plot', parents=[common], help="show the graphs in the browser")
+    stats = commands.add_parser('stats', parents=[common], help="store the leaderboard and the top voices")
+    stats.add_argument('--formats', nargs='+', choices=['md', 'csv', 'json'], help="STATISTICS_FORMATS by default")
+    export = commands.add_parser('export', parents=[common], help="store the graphs (HTML/images)")
+    export.add_argument('--formats', nargs='+', help="e.g. html jpg png (STORE_HTML/STORE_IMAGE settings by default)")
+    history = commands.add_parser('history', parents=[common], help="retrieve and plot the lengths at past dates")
+    history.add_argument('--offline', action='store_true', help="serve every call from the response cache")
+    history.add_argument('--resume', action='store_true', help="resume an interrupted retrieval from its journal")
+    history.add_argument('--plot-only', action='store_true', help="only plot the stored history (HISTORY_FILE)")
+    # Without a command everything is run (as before commands were introduced)
+    if not argv or argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['run', *argv]
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    for key, value in args.set:
+        setattr(defs, key, value)
+    COMMANDS[args.command](args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Preprocessing of the retrieved data into the tables to plot (step 4)
+"""
+import pandas as pd
+
+import defs
+from table import SparseTable
+from storage import save_to_file, iter_records
+
+
+def step4_preprocess_data_frame(create_full_df=False):
+    """Create pandas DataFrames filtering out undesired data"""
+    # Set values (depending if dataframe/dataframe_full is to create)
+    if create_full_df:
+        threshold_min_voice_length = 0
+        threshold_min_cuisines = 0
+        threshold_min_languages = 0
+        filename = 'data/table_dataframe_full'
+    else:
+        threshold_min_voice_length = defs.THRESHOLD_MIN_VOICE_LENGTH
+        threshold_min_cuisines = defs.THRESHOLD_MIN_CUISINES
+        threshold_min_languages = defs.THRESHOLD_MIN_LANGUAGES
+        filename = 'data/table_dataframe'
+
+    # Set pandas view options
+    pd.set_option('display.max_rows', None)
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', None)
+    pd.set_option('display.max_colwidth', None)
+
+    # Create full table (sparse, only cells with a length are stored), streaming the records
+    table = SparseTable.from_cuisines(iter_records('data/cuisines_length'),
+                                      row_label=lambda kk: kk.replace(defs.TOPIC_SUFFIX, ""))
+
+    # Remove short voices
+    table = table.drop_below(threshold_min_voice_length)
+
+    # Keep all languages that have least THRESHOLD_MIN_CUISINES written and all cuisines that appears in at least
+    # THRESHOLD_MIN_LANGUAGES languages (repeated until both are satisfied, the result doesn't depend on the order)
+    table, passes = table.filter_thresholds(threshold_min_cuisines, threshold_min_languages)
+    for idx, pruned in enumerate(passes):
+        print(f"[Pass {idx + 1}] Pruned {len(pruned['cols'])} languages {pruned['cols']}, "
+              f"{len(pruned['rows'])} cuisines {pruned['rows']}")
+    print(f"Threshold filtering converged after {len(passes)} passes "
+          f"({table.shape[0]} cuisines, {table.shape[1]} languages)")
+
+    df_fulltable = table.to_dataframe(index_name='Cuisine', columns_name='Wikipedia language')
+    save_to_file(filename, df_fulltable)
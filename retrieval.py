@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Retrieval of the topics pages and of their data in every language (steps 1-3)
+"""
+from bs4 import BeautifulSoup
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+
+import defs
+import dumps
+from cache import get_cache
+from storage import save_to_file, load_from_file, exists
+from utils import strip_url, split_to_chunks
+from fetch import FetchEngine, gather_with_progress, fetch_text
+from journal import Journal
+from wikiapi import (MAX_TITLES_PER_QUERY, QueryError, get_pages_info, get_pageids_info, get_category_members,
+                     get_recent_changes)
+
+# Page info stored for every (cuisine, language), revision data is used to detect changes
+PAGE_INFO_KEYS = ('length', 'lastrevid', 'touched')
+# Timestamps of the API (ISO 8601)
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def get_template_titles(template, anchor=None):
+    """Return the titles of the pages linked in a navbox template (only in the list following the anchor, if given)"""
+    soup = BeautifulSoup(fetch_text(defs.WIKI_PAGE_URL.format('en.wikipedia.org', template)), features='html.parser')
+    if anchor:
+        html_lists = [soup.find(title=anchor).find_next('ul')]
+    else:
+        html_lists = soup.select('.navbox-list ul')
+    titles = []
+    skipped = []
+    for html_list in html_lists:
+        for ch in html_list:
+            if isinstance(ch, str) or not ch.find('a'):
+                continue
+            # If it has sub-topics (e.g.: regional cuisines) consider only the first
+            link = ch.find_all('a')[0]
+            # If it's not a redirect to a different page (e.g.: "cuisine" section in the country page)
+            if not link.get('class'):
+                titles.append(unquote(link.get('href').replace('/wiki/', '')))
+            elif 'mw-redirect' in link.get('class'):
+                skipped.append((link.get('title'), 'redirect'))
+            else:
+                skipped.append((link.get('title'), ' '.join(link.get('class'))))
+    if skipped:
+        for skip, reason in skipped:
+            print(f"[Skip] {skip} ({reason})")
+    return titles
+
+
+def step1_prepare_cuisines_data():
+    """Create a data structure starting from the topics list (cuisines in Template:Cuisines by default)"""
+    with FetchEngine() as engine:
+        if defs.TOPIC_SOURCE == 'category':
+            pages = engine.run(get_category_members(engine, 'en.wikipedia.org', defs.TOPIC_CATEGORY))
+        elif defs.TOPIC_SOURCE in ('template', 'titles'):
+            if defs.TOPIC_SOURCE == 'template':
+                titles = get_template_titles(defs.TOPIC_TEMPLATE, defs.TOPIC_TEMPLATE_ANCHOR)
+            else:
+                titles = defs.TOPIC_TITLES
+            pages = engine.run(get_pages_info(engine, 'en.wikipedia.org', titles)).values()
+        else:
+            raise ValueError(f"Undefined topic source: {defs.TOPIC_SOURCE}")
+    cuisines_raw = {}
+    for vv in pages:
+        if 'pageid' in vv:
+            cuisines_raw[vv['title']] = {'pageid': str(vv['pageid']), 'languages': {}}
+        else:
+            print(f"[Skip] {vv['title']} (missing page)")
+    save_to_file('data/cuisines_raw', cuisines_raw)
+
+
+async def journal_result(journal, key, aw):
+    """Append the result of a request to the journal as soon as it arrives (failed requests aren't journaled)"""
+    try:
+        journal.append(key, await aw)
+    except QueryError as err:
+        print(f"[Skip] {err}")
+
+
+def get_pageids_langlinks(pageids, resume=False):
+    """Return info and langlinks of the pages (by pageid) from the API, journaling every chunk of pages retrieved"""
+    chunks = {'|'.join(chunk): chunk for chunk in split_to_chunks(pageids, MAX_TITLES_PER_QUERY)}
+    params = {'llprop': 'url', 'lllimit': 'max'}
+    journal = Journal('data/cuisines_langs')
+    journaled = journal.replay() if resume else {}
+    with journal.open(resume), FetchEngine() as engine:
+        engine.run(
+            gather_with_progress([
+                journal_result(
+                    journal, key,
+                    get_pageids_info(engine, 'en.wikipedia.org', chunk, 'langlinks|info', params, strict=True))
+                for key, chunk in chunks.items() if key not in journaled
+            ]))
+    pages = {}
+    for key, chunk_pages in journal.replay().items():
+        if key in chunks:
+            pages.update(chunk_pages)
+    return pages
+
+
+def step2_populate_other_languages(resume=False):
+    """Gets URLs and titles of cuisines in multiple languages (from the API or the dumps, see DATA_SOURCE)
+
+    Every chunk of pages retrieved from the API is journaled as soon as it arrives. If resume, the chunks journaled by
+    an interrupted run aren't requested again
+    """
+    cuisines_raw = load_from_file('data/cuisines_raw')
+
+    print("Getting links for every cuisine for every language...")
+    pageids = [vv['pageid'] for vv in cuisines_raw.values()]
+    if defs.DATA_SOURCE == 'dumps':
+        pages = dumps.get_pageids_info('en.wikipedia.org', pageids)
+    else:
+        pages = get_pageids_langlinks(pageids, resume)
+    for vv in cuisines_raw.values():
+        res_info = pages.get(vv['pageid'], {})
+        if 'langlinks' in res_info:
+            vv['languages'] = {
+                ll['lang']: {
+                    'title': ll['*'],
+                    'wiki_url': strip_url(ll['url'])
+                }
+                for ll in res_info['langlinks']
+            }
+            vv['languages']['en'] = {key: res_info[key] for key in PAGE_INFO_KEYS if key in res_info}
+            vv['languages']['en']['title'] = res_info['title']
+    save_to_file('data/cuisines_langs', cuisines_raw)
+    Journal('data/cuisines_langs').remove()
+
+
+async def get_pages_info_keys(engine, wiki_url, titles):
+    """Return only PAGE_INFO_KEYS of every page (keyed by the title as requested), and its title if it differs"""
+    pages = await get_pages_info(engine, wiki_url, titles, strict=True)
+    pages_keys = {}
+    for title, vv in pages.items():
+        pages_keys[title] = {key: vv[key] for key in PAGE_INFO_KEYS if key in vv}
+        if vv['title'] != title:
+            pages_keys[title]['canonical_title'] = vv['title']
+    return pages_keys
+
+
+def get_wikis_pages_info(wikis_titles, resume=False, cache=None):
+    """Return info of the pages of every wiki ({wiki_url: titles}) from the API, journaling every chunk retrieved
+
+    The wikis some chunks of which couldn't be retrieved are returned as well (cache=False bypasses the response cache)
+    """
+    chunks = {}
+    for wiki_url, titles in wikis_titles.items():
+        for chunk in split_to_chunks(titles, MAX_TITLES_PER_QUERY):
+            chunks[f"{wiki_url}|{'|'.join(chunk)}"] = (wiki_url, chunk)
+    journal = Journal('data/cuisines_length')
+    journaled = journal.replay() if resume else {}
+    with journal.open(resume), FetchEngine(cache=cache) as engine:
+        engine.run(
+            gather_with_progress([
+                journal_result(journal, key, get_pages_info_keys(engine, wiki_url, chunk))
+                for key, (wiki_url, chunk) in chunks.items() if key not in journaled
+            ]))
+    wikis_pages = {}
+    journaled = journal.replay()
+    for key, chunk_pages in journaled.items():
+        if key in chunks:
+            wikis_pages.setdefault(chunks[key][0], {}).update(chunk_pages)
+    return wikis_pages, {wiki_url for key, (wiki_url, _) in chunks.items() if key not in journaled}
+
+
+def get_canonical_title(page):
+    """Return the title of a page as listed by the API (the title of the langlink may be normalized or redirected)"""
+    return page.get('canonical_title', page['title'].replace('_', ' '))
+
+
+def get_refresh_titles(wikis_titles, wikis_previous, timestamps):
+    """Return the titles of every wiki whose info must be requested again to refresh it ({wiki_url: titles})
+
+    Only new pages and the ones changed since the last retrieval of the wiki (timestamps) are requested, the changes
+    being listed by recentchanges in at most as many calls as the info of all the pages would take. All the pages of
+    a wiki are requested if it was never retrieved, if its last retrieval is older than REFRESH_MAX_AGE_DAYS, if its
+    changes don't fit in those calls or in offline mode (changes can't be listed from the response cache)
+    """
+    oldest = (datetime.now(timezone.utc) - timedelta(days=defs.REFRESH_MAX_AGE_DAYS)).strftime(TIMESTAMP_FORMAT)
+    since = {
+        wiki_url: ts
+        for wiki_url, ts in timestamps.items() if wiki_url in wikis_titles and ts >= oldest and not defs.OFFLINE
+    }
+
+    async def get_changes(engine, wiki_url):
+        max_calls = -(-len(wikis_titles[wiki_url]) // MAX_TITLES_PER_QUERY)
+        try:
+            changed = await get_recent_changes(engine, wiki_url, since[wiki_url], max_calls)
+        except QueryError as err:
+            print(f"[Skip] {err}")
+            return None
+        if changed is None:
+            print(f"[Skip] Changes of {wiki_url} (more than {max_calls} calls), all its pages are requested")
+        return changed
+
+    with FetchEngine(cache=False) as engine:
+        wikis_changed = dict(
+            zip(since, engine.run(gather_with_progress([get_changes(engine, wiki_url) for wiki_url in since]))))
+    refresh_titles = {}
+    for wiki_url, titles in wikis_titles.items():
+        changed = wikis_changed.get(wiki_url)
+        if changed is None:
+            refresh_titles[wiki_url] = titles
+            continue
+        previous = wikis_previous.get(wiki_url, {})
+        refresh_titles[wiki_url] = [
+            title for title in titles
+            if 'length' not in previous.get(title, {}) or get_canonical_title(previous[title]) in changed
+        ]
+    return refresh_titles
+
+
+def step3_fill_lengths(incremental=False, resume=False):
+    """Retrieve the lengths of the pages via APIs (or from the dumps, see DATA_SOURCE)
+
+    If incremental (and data was already retrieved), the data is refreshed: from the API, only new pages and the ones
+    changed since the last retrieval of their wiki are requested (see get_refresh_titles, all of them when the changes
+    can't be listed), from the dumps every page is read. Pages not requested or that can't be retrieved anymore keep
+    their previous data.
+    Every chunk of pages retrieved from the API is journaled as soon as it arrives. If resume, the chunks journaled by
+    an interrupted run aren't requested again
+    """
+    # Changes can be listed with a delay, the next refresh looks for them from a few minutes before the start
+    started = (datetime.now(timezone.utc) - timedelta(minutes=10)).strftime(TIMESTAMP_FORMAT)
+    cuisines = load_from_file('data/cuisines_langs')
+    incremental = incremental and exists('data/cuisines_length')
+    if incremental:
+        cuisines_previous = load_from_file('data/cuisines_length')
+    else:
+        cuisines_previous = {}
+    timestamps = load_from_file('data/cuisines_length_timestamps') if exists('data/cuisines_length_timestamps') else {}
+
+    # Group pages by Wikipedia, doing only a few multi-title requests for every xyz.wikipedia.org (all concurrently)
+    wikis = {}
+    wikis_previous = {}
+    for kk, vv in cuisines.items():
+        for lang_prefix, page in vv['languages'].items():
+            if lang_prefix != 'en':
+                wikis.setdefault(page['wiki_url'], []).append((kk, lang_prefix))
+                page_previous = cuisines_previous.get(kk, {}).get('languages', {}).get(lang_prefix, {})
+                if page_previous.get('title') == page['title']:
+                    wikis_previous.setdefault(page['wiki_url'], {})[page['title']] = page_previous
+    wikis_titles = {
+        wiki_url: list(dict.fromkeys(cuisines[kk]['languages'][lang_prefix]['title'] for kk, lang_prefix in entries))
+        for wiki_url, entries in wikis.items()
+    }
+    if defs.DATA_SOURCE == 'dumps':
+        wikis_pages = dumps.get_wikis_pages_info(wikis_titles)
+        # The time of the dumps is unknown, the next refresh requests every page
+        timestamps = {}
+    else:
+        if incremental:
+            wikis_titles = get_refresh_titles(wikis_titles, wikis_previous, timestamps)
+            print(f"Requesting {sum(len(titles) for titles in wikis_titles.values())} new or changed pages...")
+        # Cached responses can be older than the start: a refresh bypasses the cache (unless offline), the pages read
+        # from it get no timestamp (the next refresh requests them all)
+        uncached = (incremental and not defs.OFFLINE) or get_cache() is None
+        wikis_pages, failed = get_wikis_pages_info(wikis_titles, resume, cache=False if uncached else None)
+        timestamps = {
+            wiki_url: timestamps.get(wiki_url) if wiki_url in failed else started
+            for wiki_url in wikis_titles if uncached and (wiki_url not in failed or wiki_url in timestamps)
+        }
+    keys = (*PAGE_INFO_KEYS, 'canonical_title')
+    skipped = []
+    updated = []
+    for wiki_url, entries in wikis.items():
+        pages = wikis_pages.get(wiki_url, {})
+        for kk, lang_prefix in entries:
+            page = cuisines[kk]['languages'][lang_prefix]
+            page_previous = wikis_previous.get(wiki_url, {}).get(page['title'], {})
+            page_data = pages.get(page['title'], {})
+            if 'length' in page_data:
+                page.update({key: page_data[key] for key in keys if key in page_data})
+            elif 'length' in page_previous:
+                page.update({key: page_previous[key] for key in keys if key in page_previous})
+            else:
+                skipped.append((kk, lang_prefix))
+            if incremental and 'length' in page and page.get('lastrevid') != page_previous.get('lastrevid'):
+                updated.append((kk, lang_prefix))
+    if skipped:
+        for page, lang in skipped:
+            print(f"[Skip] {page} in language {lang} (unavailable length)")
+    if incremental:
+        for page, lang in updated:
+            print(f"[Update] {page} in language {lang}")
+        print(f"{len(updated)} pages updated (new or with a new revision)")
+    save_to_file('data/cuisines_length', cuisines)
+    save_to_file('data/cuisines_length_timestamps', timestamps)
+    Journal('data/cuisines_length').remove()
+
+
+def get_wikimedia_languages_list():
+    """Download and create a correlation dict from language prefixes to long language names"""
+    wiki_languages = {}
+    soup = BeautifulSoup(fetch_text(defs.WIKI_PAGE_URL.format('meta.wikimedia.org', 'Table_of_Wikimedia_projects')),
+                         features='html.parser')
+    table = soup.find_all('table', class_='sortable')[0]
+    for tr in table.find_all('tr'):
+        tds = tr.find_all('td')
+        if not tds:
+            continue
+        code, english_name, local_name = [td.text.strip() for td in tds[:3]]
+        code = code.replace(':', '')
+        wiki_languages[code] = {'eng_name': english_name, 'local_name': local_name}
+    save_to_file('data/wiki_languages', wiki_languages)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Dependency-aware scheduler of the pipeline steps
+"""
+import hashlib
+import importlib
+import json
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import defs
+
+from instrumentation import METRICS
+from storage import exists, artifact_files
+
+
+class Step:
+    """Pipeline step, declaring the artifacts it reads and writes and the settings (defs) it depends on
+
+    The function can be given as 'module.function', the module being imported only if the step runs
+    """
+    def __init__(self, func, inputs=(), outputs=(), config=(), name=None, kwargs=None):
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.config = list(config)
+        self.name = name or (func.rpartition('.')[2] if isinstance(func, str) else func.__name__)
+        self.kwargs = kwargs or {}
+
+    def __call__(self):
+        if isinstance(self.func, str):
+            module, _, name = self.func.rpartition('.')
+            self.func = getattr(importlib.import_module(module), name)
+        return self.func(**self.kwargs)
+
+
+def hash_artifact(file):
+    """Return the hash of the content of an artifact"""
+    sha = hashlib.sha256()
+    for path in artifact_files(file):
+        sha.update(path.name.encode())
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+class Scheduler:
+    """Run the steps whose outputs are missing or whose inputs/settings changed since their last run
+
+    The hashes of inputs and settings of every successful run are stored in state_file.
+    Independent steps are run in parallel, each one as soon as the steps producing its inputs are done
+    """
+    def __init__(self, steps, state_file='data/.steps_state.json'):
+        self.steps = {step.name: step for step in steps}
+        self.state_file = Path(state_file)
+        self.state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        self._lock = threading.Lock()
+        producers = {output: step.name for step in steps for output in step.outputs}
+        self.dependencies = {
+            step.name: {producers[file] for file in step.inputs if file in producers}
+            for step in steps
+        }
+
+    def fingerprint(self, step):
+        """Return the current hashes of the inputs and settings of a step"""
+        return {
+            'inputs': {file: hash_artifact(file) if exists(file) else None for file in step.inputs},
+            'config': {key: repr(getattr(defs, key)) for key in step.config}
+        }
+
+    def check(self, step, force=()):
+        """Return why the step has to run (None if it's up to date)"""
+        if step.name in force:
+            return "forced"
+        missing = [file for file in step.outputs if not exists(file)]
+        if missing:
+            return f"missing output {', '.join(missing)}"
+        if step.name not in self.state:
+            # Outputs produced before the scheduler was used are adopted as they are
+            return None
+        previous = self.state[step.name]
+        current = self.fingerprint(step)
+        changed = [key for key, value in current['config'].items() if previous['config'].get(key) != value]
+        if changed:
+            return f"changed setting {', '.join(changed)}"
+        changed = [file for file, value in current['inputs'].items() if previous['inputs'].get(file) != value]
+        if changed:
+            return f"changed input {', '.join(changed)}"
+        return None
+
+    def reason(self, step, force=(), regenerated=(), predict=False):
+        """Return why the step has to run given the steps regenerating its inputs (None if it's up to date)
+
+        Outputs without a recorded state can't be adopted once their inputs have been regenerated. If predict, the
+        inputs of the other steps are assumed to change too (their hashes are only known once regenerated)
+        """
+        reason = self.check(step, force)
+        if reason is None and regenerated and (predict or step.name not in self.state):
+            reason = f"inputs regenerated by {', '.join(sorted(regenerated))}"
+        return reason
+
+    def _ordered(self):
+        ordered, done = [], set()
+        while len(ordered) < len(self.steps):
+            ready = [name for name in self.steps if name not in done and self.dependencies[name] <= done]
+            if not ready:
+                raise ValueError(f"Circular dependencies between steps {', '.join(sorted(set(self.steps) - done))}")
+            ordered += [self.steps[name] for name in ready]
+            done.update(ready)
+        return ordered
+
+    def plan(self, force=()):
+        """Return, in order, every step with the reason why it would run (None if it wouldn't)"""
+        plan, to_run = [], set()
+        for step in self._ordered():
+            reason = self.reason(step, force, self.dependencies[step.name] & to_run, predict=True)
+            if reason:
+                to_run.add(step.name)
+            plan.append((step, reason))
+        return plan
+
+    def explain(self, force=()):
+        """Print which steps would run and why"""
+        for step, reason in self.plan(force):
+            print(f"[{'Run' if reason else 'Skip'}] {step.name}: {reason or 'up to date'}")
+
+    def _record(self, step):
+        with self._lock:
+            self.state[step.name] = self.fingerprint(step)
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            self.state_file.write_text(json.dumps(self.state, indent=2))
+
+    def _run_step(self, step, force, regenerated):
+        """Run the step if it's not up to date, return whether it was run"""
+        reason = self.reason(step, force, regenerated)
+        if reason is None:
+            if step.name not in self.state:
+                self._record(step)
+            return False
+        print(f"Running {step.name} ({reason})...")
+        with METRICS.step(step.name):
+            step()
+        self._record(step)
+        return True
+
+    def run(self, force=()):
+        """Run the steps that are not up to date, in parallel where possible"""
+        self._ordered()
+        pending = dict(self.steps)
+        done, ran = set(), set()
+        with ThreadPoolExecutor(max_workers=len(self.steps) or 1) as executor:
+            running = {}
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if self.dependencies[name] <= done:
+                        del pending[name]
+                        regenerated = self.dependencies[name] & ran
+                        running[executor.submit(self._run_step, step, force, regenerated)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.result():
+                        ran.add(name)
+                    done.add(name)
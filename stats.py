@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Statistics of the full table: cuisines leaderboard and top voices (longest pages)
+
+Rankings are computed with a top-k selection over the whole (cuisine × language) matrix, URLs of the ranked pages are
+looked up in a (cuisine, language) index built in one pass over the stored records
+"""
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+
+import defs
+
+from storage import iter_records
+from utils import get_flags_from_demonyms, get_languages_names
+
+
+def top_k(values, k, axis=None):
+    """Return the indexes of the k largest values (NaN excluded), sorted from the largest, ties by index
+
+    With an axis, the k largest of every slice along it (as an array with k entries per slice, NaN entries included
+    if a slice has less than k values)
+    """
+    values = np.where(np.isnan(values), -np.inf, values)
+    if axis is None:
+        values, axis = values.ravel(), 0
+        k = min(k, np.isfinite(values).sum())
+    k = min(k, values.shape[axis])
+    values = np.moveaxis(values, axis, -1)
+    if k == 0:
+        return np.moveaxis(np.empty((*values.shape[:-1], 0), dtype=np.int64), -1, axis)
+    # Values above the k-th largest, then the first ones (by index) equal to it, as a stable sort would keep
+    kth = -np.partition(-values, k - 1, axis=-1)[..., k - 1:k]
+    above, ties = values > kth, values == kth
+    selected = above | (ties & (np.cumsum(ties, axis=-1) <= k - above.sum(axis=-1, keepdims=True)))
+    idx = np.nonzero(selected)[-1].reshape(*values.shape[:-1], k)
+    idx = np.take_along_axis(idx, np.argsort(-np.take_along_axis(values, idx, -1), axis=-1, kind='stable'), -1)
+    return np.moveaxis(idx, -1, axis)
+
+
+def get_leaderboard(df_full, k):
+    """Return the k cuisines with the largest total length of their pages"""
+    sums = np.nansum(df_full.to_numpy(), axis=1)
+    idx = top_k(sums, k)
+    return pd.DataFrame({'length': sums[idx].astype(int)}, index=pd.Index(df_full.index[idx], name='cuisine'))
+
+
+def get_top_voices(df_full, k, per_cuisine):
+    """Return the k longest pages (cuisine, language, length), considering at most per_cuisine pages of a cuisine"""
+    values = df_full.to_numpy()
+    cols = top_k(values, per_cuisine, axis=1)
+    candidates = np.take_along_axis(values, cols, axis=1)
+    idx = top_k(candidates, k)
+    rows, cols = idx // cols.shape[1], cols.ravel()[idx]
+    return pd.DataFrame({
+        'cuisine': df_full.index[rows],
+        'language': df_full.columns[cols],
+        'length': values[rows, cols].astype(int)
+    })
+
+
+def get_urls_index(records, cells):
+    """Return {(cuisine, language): (page, url)} of the given cells, streaming the (key, record) pairs once"""
+    cuisines = {cuisine for cuisine, _ in cells}
+    index = {}
+    for kk, vv in records:
+        cuisine = kk.replace(defs.TOPIC_SUFFIX, '')
+        if cuisine not in cuisines:
+            continue
+        for lang, page in vv['languages'].items():
+            if (cuisine, lang) in cells:
+                wiki_url = page.get('wiki_url', 'en.wikipedia.org')
+                url = defs.WIKI_PAGE_URL.format(wiki_url, page['title'].replace(' ', '_'))
+                index[(cuisine, lang)] = (f'{kk} ({lang})', url)
+    return index
+
+
+def store_table(df, name, formats):
+    """Store a statistics table in results/ in every format ('md'/'csv'/'json')"""
+    for fmt in formats:
+        path = Path(f'results/{name}.{fmt}')
+        if fmt == 'md':
+            if 'page' in df:
+                # Pages as links
+                links = [f'[{page}]({url})' for page, url in zip(df['page'], df['url'])]
+                path.write_text(df.drop(columns='page').assign(url=links).to_markdown())
+            else:
+                path.write_text(df.to_markdown())
+        elif fmt == 'csv':
+            df.to_csv(path)
+        elif fmt == 'json':
+            df.to_json(path, orient='index', force_ascii=False, indent=2)
+        else:
+            raise ValueError(f"Unsupported statistics format: {fmt}")
+
+
+def store_statistics(df_full, records_file='data/cuisines_langs'):
+    """Compute and store the cuisines leaderboard and the top voices"""
+    leaderboard = get_leaderboard(df_full, defs.STATISTICS_TOP_CUISINES)
+    leaderboard.index = [f"{flag} {cuisine}" for flag, cuisine in zip(get_flags_from_demonyms(leaderboard.index),
+                                                                       leaderboard.index)]
+    leaderboard.index.name = 'cuisine'
+    store_table(leaderboard, 'cuisines_leaderboard', defs.STATISTICS_FORMATS)
+
+    top_voices = get_top_voices(df_full, defs.STATISTICS_TOP_VOICES, defs.STATISTICS_VOICES_PER_CUISINE)
+    cells = list(zip(top_voices['cuisine'], top_voices['language']))
+    index = get_urls_index(iter_records(records_file), set(cells))
+    top_voices['page'] = [index.get(cell, (f'{cell[0]}{defs.TOPIC_SUFFIX} ({cell[1]})', ''))[0] for cell in cells]
+    top_voices['url'] = [index.get(cell, ('', ''))[1] for cell in cells]
+    flags = get_flags_from_demonyms(top_voices['cuisine'])
+    top_voices['cuisine'] = [f"{flag} {cuisine}" for flag, cuisine in zip(flags, top_voices['cuisine'])]
+    top_voices['language'] = get_languages_names(top_voices['language'])
+    store_table(top_voices, 'cuisines_top', defs.STATISTICS_FORMATS)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Storage of the pipeline artifacts
+
+Tables (DataFrames) are stored as a directory with a column-major .npy file (memory-mapped when loaded) and their
+labels, nested dicts as JSON lines with an index of the byte offset of every key. Both can be partially loaded.
+NumPy and pandas are imported by the functions handling tables (commands not loading tables start faster).
+Artifacts pickled by previous versions (.dat files) are converted the first time they're loaded
+"""
+import json
+import os
+import pickle
+
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def _records_paths(file):
+    return Path(f'{file}.jsonl'), Path(f'{file}.idx.json')
+
+
+@contextmanager
+def _replacing(path, mode='wb', encoding=None):
+    """Open a temporary file replacing path once written, so that an interrupted save leaves the previous file"""
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, mode, encoding=encoding) as fp:
+            yield fp
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def save_table(file, df):
+    """Store a DataFrame of numbers column by column"""
+    import numpy as np
+
+    path = Path(file)
+    path.mkdir(parents=True, exist_ok=True)
+    with _replacing(path / 'values.npy') as fp:
+        np.save(fp, np.asfortranarray(df.to_numpy(dtype=np.float64)))
+    labels = {
+        'index': df.index.to_list(),
+        'index_name': df.index.name,
+        'columns': df.columns.to_list(),
+        'columns_name': df.columns.name
+    }
+    with _replacing(path / 'labels.json', 'w', encoding='utf-8') as fp:
+        json.dump(labels, fp, ensure_ascii=False)
+
+
+def load_table(file, columns=None):
+    """Load a stored DataFrame, reading only the given columns (all if None)"""
+    import numpy as np
+    import pandas as pd
+
+    path = Path(file)
+    with open(path / 'labels.json', 'r', encoding='utf-8') as fp:
+        labels = json.load(fp)
+    # Copy-on-write mapping: only the pages read are loaded, the DataFrame can still be modified
+    values = np.load(path / 'values.npy', mmap_mode='c')
+    if columns is None:
+        columns = labels['columns']
+    else:
+        col_index = {col: idx for idx, col in enumerate(labels['columns'])}
+        values = values[:, [col_index[col] for col in columns]]
+    return pd.DataFrame(np.asarray(values),
+                        index=pd.Index(labels['index'], name=labels['index_name']),
+                        columns=pd.Index(columns, name=labels['columns_name']))
+
+
+def save_records(file, records):
+    """Store a dict of JSON-serializable records, one per line, indexing the position of every key"""
+    jsonl_path, idx_path = _records_paths(file)
+    jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+    index = {}
+    with _replacing(jsonl_path) as fp:
+        for kk, vv in records.items():
+            line = json.dumps(vv, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+            index[kk] = (fp.tell(), len(line))
+            fp.write(line)
+    with _replacing(idx_path, 'w', encoding='utf-8') as fp:
+        json.dump(index, fp, ensure_ascii=False)
+
+
+def load_records(file, keys=None):
+    """Load stored records, reading only the given keys (all if None)"""
+    jsonl_path, idx_path = _records_paths(file)
+    if keys is None:
+        with open(idx_path, 'r', encoding='utf-8') as fp:
+            keys = [*json.load(fp)]
+        with open(jsonl_path, 'rb') as fp:
+            return {kk: json.loads(line) for kk, line in zip(keys, fp)}
+    with open(idx_path, 'r', encoding='utf-8') as fp:
+        index = json.load(fp)
+    records = {}
+    with open(jsonl_path, 'rb') as fp:
+        for kk in keys:
+            if kk in index:
+                offset, length = index[kk]
+                fp.seek(offset)
+                records[kk] = json.loads(fp.read(length))
+    return records
+
+
+def iter_records(file):
+    """Yield (key, record) of stored records one at a time, without loading all of them"""
+    migrate_legacy(file)
+    jsonl_path, idx_path = _records_paths(file)
+    with open(idx_path, 'r', encoding='utf-8') as fp:
+        keys = [*json.load(fp)]
+    with open(jsonl_path, 'rb') as fp:
+        for kk, line in zip(keys, fp):
+            yield kk, json.loads(line)
+
+
+def save_to_file(file, obj):
+    """Store an artifact: DataFrames as tables, dicts as records"""
+    if isinstance(obj, dict):
+        save_records(file, obj)
+    elif type(obj).__name__ == 'DataFrame':
+        save_table(file, obj)
+    else:
+        raise TypeError(f"Unsupported artifact type: {type(obj)}")
+
+
+def migrate_legacy(file):
+    """Convert the artifact pickled by previous versions (file.dat) if it hasn't been stored yet, return whether it was
+
+    The .dat file is kept, it's ignored once converted
+    """
+    legacy = Path(f'{file}.dat')
+    if not legacy.exists() or _stored(file):
+        return False
+    with open(legacy, 'rb') as fp:
+        obj = pickle.load(fp)
+    save_to_file(file, obj)
+    print(f"[Migrate] {legacy} converted to the current storage format")
+    return True
+
+
+def load_from_file(file, keys=None, columns=None):
+    """Load an artifact, reading only the given record keys/table columns"""
+    migrate_legacy(file)
+    if (Path(file) / 'labels.json').exists():
+        return load_table(file, columns)
+    return load_records(file, keys)
+
+
+def _stored(file):
+    return (Path(file) / 'labels.json').exists() or all(path.exists() for path in _records_paths(file))
+
+
+def exists(file):
+    """Check if an artifact has been stored (or pickled by previous versions, it's converted once loaded)"""
+    return _stored(file) or Path(f'{file}.dat').exists()
+
+
+def artifact_files(file):
+    """Return the files an artifact is made of"""
+    if (Path(file) / 'labels.json').exists():
+        return sorted(path for path in Path(file).iterdir() if path.is_file())
+    if not _stored(file) and Path(f'{file}.dat').exists():
+        return [Path(f'{file}.dat')]
+    return [path for path in _records_paths(file) if path.exists()]
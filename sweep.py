@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sweep of the step4 thresholds: shape, coverage and retained cuisines/languages of the table for every combination
+
+Page lengths are loaded once. The table without short pages is built once per minimum length, the filtering of every
+(minimum cuisines, minimum languages) pair reuses its counts and cells indices. Work is split among processes
+"""
+import json
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import product
+from pathlib import Path
+
+import defs
+
+from storage import iter_records, save_to_file
+from table import SparseTable
+from utils import split_to_chunks
+
+# Filtered tables, stored if requested (minimum length, cuisines and languages), and results of every combination
+SWEEP_TABLE_FILE = 'data/sweep/table_dataframe_{}_{}_{}'
+SWEEP_RESULTS_FILE = 'results/threshold_sweep.json'
+
+# Table shared by the worker processes
+_TABLE = None
+
+
+def load_table():
+    """Return the full table of page lengths"""
+    return SparseTable.from_cuisines(iter_records('data/cuisines_length'),
+                                     row_label=lambda kk: kk.replace(defs.TOPIC_SUFFIX, ""))
+
+
+def _init_worker(table):
+    global _TABLE
+    _TABLE = table
+
+
+@lru_cache(maxsize=None)
+def _drop_below(min_length):
+    return _TABLE.drop_below(min_length)
+
+
+def evaluate(min_length, pairs, store=False):
+    """Return shape, coverage and retained labels of the table for every (min cuisines, min languages) pair"""
+    table = _drop_below(min_length)
+    results = []
+    for min_cuisines, min_languages in pairs:
+        keep_rows, keep_cols, passes = table.threshold_masks(min_cuisines, min_languages)
+        n_rows, n_cols = keep_rows.sum(), keep_cols.sum()
+        pages = (keep_rows[table.rows] & keep_cols[table.cols]).sum()
+        results.append({
+            'min_length': min_length,
+            'min_cuisines': min_cuisines,
+            'min_languages': min_languages,
+            'cuisines': int(n_rows),
+            'languages': int(n_cols),
+            'pages': int(pages),
+            'coverage': float(pages / (n_rows * n_cols)) if n_rows and n_cols else 0.0,
+            'passes': len(passes),
+            'retained_cuisines': [label for label, keep in zip(table.row_labels, keep_rows) if keep],
+            'retained_languages': [label for label, keep in zip(table.col_labels, keep_cols) if keep]
+        })
+        if store:
+            df = table.select(keep_rows, keep_cols).to_dataframe(index_name='Cuisine',
+                                                                 columns_name='Wikipedia language')
+            save_to_file(SWEEP_TABLE_FILE.format(min_length, min_cuisines, min_languages), df)
+    return results
+
+
+def sweep(table, min_lengths, min_cuisines, min_languages, store=False, workers=None):
+    """Evaluate every combination of the thresholds, return the results (one per combination)"""
+    workers = workers or defs.SWEEP_WORKERS
+    pairs = list(product(min_cuisines, min_languages))
+    chunk_size = -(-len(pairs) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(table, )) as executor:
+        futures = [
+            executor.submit(evaluate, min_length, chunk, store) for min_length in min_lengths
+            for chunk in split_to_chunks(pairs, chunk_size)
+        ]
+        return [result for future in futures for result in future.result()]
+
+
+def store_sweep(min_lengths, min_cuisines, min_languages, store=False, workers=None, output=SWEEP_RESULTS_FILE):
+    """Sweep the thresholds over the full table, print the results and store them (with the retained labels)"""
+    table = load_table()
+    print(f"Sweeping {len(min_lengths) * len(min_cuisines) * len(min_languages)} combinations "
+          f"({table.shape[0]} cuisines, {table.shape[1]} languages)...")
+    results = sweep(table, min_lengths, min_cuisines, min_languages, store, workers)
+
+    pd.set_option('display.max_rows', None)
+    df = pd.DataFrame(results).drop(columns=['retained_cuisines', 'retained_languages'])
+    print(df.round(3).to_string(index=False))
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as fp:
+        json.dump(results, fp, ensure_ascii=False, indent=2)
+    return results
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Sparse (cuisine × language) table of page lengths
+"""
+import numpy as np
+import pandas as pd
+
+from array import array
+from functools import cached_property
+
+
+class SparseTable:
+    """Table stored as coordinates: only the cells with a value are kept (rows, cols and values arrays)"""
+    def __init__(self, row_labels, col_labels, rows, cols, values):
+        self.row_labels = list(row_labels)
+        self.col_labels = list(col_labels)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @property
+    def shape(self):
+        return len(self.row_labels), len(self.col_labels)
+
+    @classmethod
+    def from_cuisines(cls, cuisines, row_label=None):
+        """Build the table in one pass over the nested cuisines dict or (key, record) iterable
+
+        Only the coordinates arrays are kept, so records can be streamed. Columns are sorted by language
+        """
+        row_labels = []
+        col_index = {}
+        rows, cols, values = array('q'), array('q'), array('d')
+        for row, (kk, vv) in enumerate(cuisines.items() if isinstance(cuisines, dict) else cuisines):
+            row_labels.append(row_label(kk) if row_label else kk)
+            for lang, page in vv['languages'].items():
+                col = col_index.setdefault(lang, len(col_index))
+                if 'length' in page:
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(page['length'])
+        col_labels = sorted(col_index)
+        col_remap = np.empty(len(col_index), dtype=np.int64)
+        col_remap[[col_index[lang] for lang in col_labels]] = np.arange(len(col_labels))
+        return cls(row_labels, col_labels, rows, col_remap[np.frombuffer(cols, dtype=np.int64)], values)
+
+    def select(self, keep_rows, keep_cols=None, keep_cells=None):
+        """Return a new table with only the rows/columns/cells whose mask is True"""
+        keep_cols = np.ones(self.shape[1], dtype=bool) if keep_cols is None else keep_cols
+        mask = keep_rows[self.rows] & keep_cols[self.cols]
+        if keep_cells is not None:
+            mask &= keep_cells
+        row_remap = np.cumsum(keep_rows) - 1
+        col_remap = np.cumsum(keep_cols) - 1
+        return SparseTable([label for label, keep in zip(self.row_labels, keep_rows) if keep],
+                           [label for label, keep in zip(self.col_labels, keep_cols) if keep],
+                           row_remap[self.rows[mask]], col_remap[self.cols[mask]], self.values[mask])
+
+    def drop_below(self, min_value):
+        """Return a new table without the cells whose value is lower than min_value"""
+        return self.select(np.ones(self.shape[0], dtype=bool), keep_cells=self.values >= min_value)
+
+    def counts(self):
+        """Return the number of cells with a value for every row and every column"""
+        return np.bincount(self.rows, minlength=self.shape[0]), np.bincount(self.cols, minlength=self.shape[1])
+
+    @cached_property
+    def _cells_index(self):
+        """Cells grouped by row and by column (CSR/CSC-like indices), shared by every threshold filtering"""
+        row_counts, col_counts = self.counts()
+        return (row_counts, col_counts, np.argsort(self.rows, kind='stable'), np.argsort(self.cols, kind='stable'),
+                np.concatenate(([0], np.cumsum(row_counts))), np.concatenate(([0], np.cumsum(col_counts))))
+
+    def threshold_masks(self, min_per_col, min_per_row):
+        """Return the masks of the rows and columns kept by filter_thresholds and the indexes pruned at every pass"""
+        row_counts, col_counts, by_row, by_col, row_ptr, col_ptr = self._cells_index
+        row_counts, col_counts = row_counts.copy(), col_counts.copy()
+        keep_rows = np.ones(self.shape[0], dtype=bool)
+        keep_cols = np.ones(self.shape[1], dtype=bool)
+
+        def cells(order, ptr, idx):
+            starts, lengths = ptr[idx], ptr[idx + 1] - ptr[idx]
+            offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            return order[np.repeat(starts, lengths) + offsets]
+
+        passes = []
+        while True:
+            drop_cols = np.flatnonzero(keep_cols & (col_counts < min_per_col))
+            keep_cols[drop_cols] = False
+            row_counts -= np.bincount(self.rows[cells(by_col, col_ptr, drop_cols)], minlength=self.shape[0])
+            drop_rows = np.flatnonzero(keep_rows & (row_counts < min_per_row))
+            keep_rows[drop_rows] = False
+            col_counts -= np.bincount(self.cols[cells(by_row, row_ptr, drop_rows)], minlength=self.shape[1])
+            if not len(drop_cols) and not len(drop_rows):
+                break
+            passes.append({'rows': drop_rows, 'cols': drop_cols})
+        return keep_rows, keep_cols, passes
+
+    def filter_thresholds(self, min_per_col, min_per_row):
+        """Remove columns with less than min_per_col values and rows with less than min_per_row values, until stable
+
+        The result doesn't depend on the order of removal (it is the largest sub-table satisfying both thresholds).
+        Counts are updated incrementally, only the cells of removed rows/columns are visited.
+        Return the filtered table and, for every pass, the labels of the pruned rows and columns
+        """
+        keep_rows, keep_cols, passes = self.threshold_masks(min_per_col, min_per_row)
+        return self.select(keep_rows, keep_cols), [{
+            'rows': [self.row_labels[ii] for ii in pruned['rows']],
+            'cols': [self.col_labels[ii] for ii in pruned['cols']]
+        } for pruned in passes]
+
+    def to_numpy(self):
+        """Return the dense table (NaN where there is no value)"""
+        dense = np.full(self.shape, np.nan)
+        dense[self.rows, self.cols] = self.values
+        return dense
+
+    def to_dataframe(self, index_name=None, columns_name=None):
+        """Return the dense table as a pandas DataFrame"""
+        return pd.DataFrame(self.to_numpy(),
+                            index=pd.Index(self.row_labels, name=index_name),
+                            columns=pd.Index(self.col_labels, name=columns_name))
@@ -0,0 +1,6 @@
+import sys
+
+from pathlib import Path
+
+# Modules are flat at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
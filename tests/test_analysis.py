@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+import defs
+
+from analysis import correlation, get_order
+
+
+def pairwise_spearman(values, min_periods):
+    n_vars = values.shape[1]
+    corr = np.full((n_vars, n_vars), np.nan)
+    for ii in range(n_vars):
+        for jj in range(n_vars):
+            common = ~np.isnan(values[:, ii]) & ~np.isnan(values[:, jj])
+            if common.sum() >= min_periods:
+                ranks = pd.DataFrame(values[common][:, [ii, jj]]).rank().to_numpy()
+                corr[ii, jj] = np.corrcoef(ranks.T)[0, 1]
+    return corr
+
+
+def test_spearman_ranks_the_rows_of_every_pair():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(9, 1, (40, 6))
+    values[rng.random(values.shape) < 0.4] = np.nan
+    np.testing.assert_allclose(correlation(values, 'spearman', 3), pairwise_spearman(values, 3), atol=1e-12)
+
+
+def test_pearson_matches_pandas_on_log_lengths():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(9, 1, (50, 7))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    expected = pd.DataFrame(np.log(values)).corr(min_periods=3).to_numpy()
+    np.testing.assert_allclose(correlation(values, 'pearson', 3, block_size=3), expected, atol=1e-12)
+
+
+def test_linkage_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(defs, 'ANALYSIS_DIR', str(tmp_path))
+    monkeypatch.setattr(defs, 'ANALYSIS_CACHE_SIZE', 2)
+    rng = np.random.default_rng(2)
+    for _ in range(4):
+        values = rng.lognormal(9, 1, (20, 5))
+        assert get_order(values) == get_order(values, corr=correlation(values))
+    assert len(list(tmp_path.glob('linkage_*.npy'))) == 2
@@ -0,0 +1,28 @@
+import pytest
+
+from pathlib import Path
+
+from benchmark import run_dataset, compare
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_small_dataset_keeps_a_non_empty_table(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    result = run_dataset({'n_cuisines': 50, 'n_languages': 40, 'density': 0.5}, latency=0.0)
+    assert result['pages'] > 0
+    assert min(result['table']) > 0
+    assert {'step3_fill_lengths', 'step4_compute_correlations', 'step5_create_plots'} <= set(result['steps'])
+
+
+def test_sparse_dataset_is_rejected(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    with pytest.raises(ValueError, match='Empty filtered table'):
+        run_dataset({'n_cuisines': 20, 'n_languages': 10, 'density': 0.1}, latency=0.0)
+
+
+def test_regressions_beyond_tolerance():
+    baseline = {'small': {'throughput': 100.0, 'peak_rss': 100.0}}
+    assert compare({'small': {'throughput': 85.0, 'peak_rss': 115.0}}, baseline, 0.2) == []
+    regressions = compare({'small': {'throughput': 70.0, 'peak_rss': 130.0}}, baseline, 0.2)
+    assert len(regressions) == 2
@@ -0,0 +1,23 @@
+import defs
+
+from cache import ResponseCache, get_cache
+
+
+def test_one_cache_per_configuration(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', True)
+    monkeypatch.setattr(defs, 'OFFLINE', False)
+    scans = []
+    entries = ResponseCache._entries
+    monkeypatch.setattr(ResponseCache, '_entries', lambda self: scans.append(self.path) or entries(self))
+
+    cache = get_cache()
+    cache.put(cache.key('GET', 'https://example.org'), b'content')
+    assert get_cache() is cache and get_cache().size == len(b'content')
+    assert len(scans) == 1
+    monkeypatch.setattr(defs, 'CACHE_TTL', defs.CACHE_TTL + 1)
+    assert get_cache() is not cache
+    monkeypatch.setattr(defs, 'CACHE_DIR', 'other')
+    assert get_cache().path.name == 'other'
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', False)
+    assert get_cache() is None
@@ -0,0 +1,87 @@
+import gzip
+import pytest
+
+import defs
+import dumps
+
+PAGE_DUMP = r"""-- MySQL dump 10.19
+DROP TABLE IF EXISTS `page`;
+CREATE TABLE `page` (
+  `page_id` int(8) unsigned NOT NULL AUTO_INCREMENT,
+  `page_namespace` int(11) NOT NULL DEFAULT 0,
+  `page_title` varbinary(255) NOT NULL DEFAULT '',
+  `page_is_redirect` tinyint(1) unsigned NOT NULL DEFAULT 0,
+  `page_touched` binary(14) NOT NULL,
+  `page_latest` int(8) unsigned NOT NULL DEFAULT 0,
+  `page_len` int(8) unsigned NOT NULL DEFAULT 0,
+  `page_lang` varbinary(35) DEFAULT NULL,
+  PRIMARY KEY (`page_id`),
+  KEY `page_len` (`page_len`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+INSERT INTO `page` VALUES (1,0,'Cucina_italiana',0,'20230412093011',111,5000,NULL);
+INSERT INTO `page` VALUES (2,0,'L\'osteria_(Roma)',0,'20230101000000',222,1200,'it');
+INSERT INTO `page` VALUES (3,0,'Back\\slash_),(_\"x\"',0,'20220101120000',333,42,NULL);
+INSERT INTO `page` VALUES (4,0,'Roma',1,'20230412093011',444,30,NULL),(5,1,'Pizza',0,'20230412093011',555,800,NULL);
+"""
+
+LANGLINKS_DUMP = r"""CREATE TABLE `langlinks` (
+  `ll_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `ll_lang` varbinary(35) NOT NULL DEFAULT '',
+  `ll_title` varbinary(255) NOT NULL DEFAULT '',
+  PRIMARY KEY (`ll_from`,`ll_lang`)
+) ENGINE=InnoDB DEFAULT CHARSET=binary;
+INSERT INTO `langlinks` VALUES (1,'fr','Cuisine d\'Italie'),(1,'de','Italienische Küche'),(1,'ja','');
+INSERT INTO `langlinks` VALUES (2,'en','The (Roman) tavern');
+"""
+
+
+@pytest.fixture
+def dumps_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(defs, 'DUMPS_DIR', str(tmp_path))
+    for dbname, table, content in (('itwiki', 'page', PAGE_DUMP), ('itwiki', 'langlinks', LANGLINKS_DUMP),
+                                   ('be_x_oldwiki', 'page', PAGE_DUMP)):
+        with gzip.open(tmp_path / defs.DUMP_FILE.format(wiki=dbname, table=table), 'wt', encoding='utf-8') as fp:
+            fp.write(content)
+    return tmp_path
+
+
+def test_rows_with_escapes_and_parentheses(dumps_dir):
+    rows = list(dumps.iter_rows(dumps.get_dump_file('it.wikipedia.org', 'page'),
+                                ('page_id', 'page_title', 'page_len', 'page_lang')))
+    assert rows == [('1', 'Cucina_italiana', '5000', None), ('2', "L'osteria_(Roma)", '1200', 'it'),
+                    ('3', 'Back\\slash_),(_"x"', '42', None), ('4', 'Roma', '30', None), ('5', 'Pizza', '800', None)]
+
+
+def test_pages_filtered_by_namespace_and_redirect(dumps_dir):
+    pages = dumps.scan_pages('it.wikipedia.org', titles=['Cucina italiana', "L'osteria (Roma)", 'Roma', 'Pizza'])
+    assert pages == {
+        'Cucina italiana': {'pageid': 1, 'title': 'Cucina italiana', 'length': 5000, 'lastrevid': 111,
+                            'touched': '2023-04-12T09:30:11Z'},
+        "L'osteria (Roma)": {'pageid': 2, 'title': "L'osteria (Roma)", 'length': 1200, 'lastrevid': 222,
+                             'touched': '2023-01-01T00:00:00Z'},
+        # Redirects have no length (they aren't followed), pages of other namespaces (Discussione:Pizza) are ignored
+        'Roma': {'pageid': 4, 'title': 'Roma'}
+    }
+    assert dumps.scan_pages('it.wikipedia.org', pageids=['3', '5'])['3']['title'] == 'Back\\slash ),( "x"'
+    assert '5' not in dumps.scan_pages('it.wikipedia.org', pageids=['5'])
+
+
+def test_langlinks(dumps_dir):
+    langlinks = dumps.scan_langlinks('it.wikipedia.org', ['1'])
+    assert langlinks == {'1': [
+        {'lang': 'fr', '*': "Cuisine d'Italie", 'url': 'https://fr.wikipedia.org/wiki/Cuisine_d%27Italie'},
+        {'lang': 'de', '*': 'Italienische Küche', 'url': 'https://de.wikipedia.org/wiki/Italienische_K%C3%BCche'}
+    ]}
+    pages = dumps.get_pageids_info('it.wikipedia.org', ['1', '2'])
+    assert [ll['*'] for ll in pages['2']['langlinks']] == ['The (Roman) tavern']
+
+
+def test_dbname_exceptions(dumps_dir):
+    assert dumps.get_dbname('it.wikipedia.org') == 'itwiki'
+    assert dumps.get_dbname('zh-min-nan.wikipedia.org') == 'zh_min_nanwiki'
+    assert dumps.get_dbname('be-tarask.wikipedia.org') == 'be_x_oldwiki'
+    wikis_pages = dumps.get_wikis_pages_info({'be-tarask.wikipedia.org': ['Cucina italiana'],
+                                              'fr.wikipedia.org': ['Cuisine italienne']})
+    assert wikis_pages['be-tarask.wikipedia.org']['Cucina italiana']['length'] == 5000
+    # Missing dump
+    assert wikis_pages['fr.wikipedia.org'] == {}
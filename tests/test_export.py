@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+import defs
+
+from export import export_figures
+from visualization import create_heatmap
+
+
+def lod_heatmap(monkeypatch):
+    monkeypatch.setattr(defs, 'HEATMAP_LOD_MIN_CELLS', 100)
+    monkeypatch.setattr(defs, 'HEATMAP_ORDER', 'alphabetical')
+    monkeypatch.setattr(defs, 'Y_REPLACE_LANGUAGES_ABBREVIATIONS', False)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.lognormal(9, 1, (20, 30)), index=[f"l{idx:02d}" for idx in range(20)],
+                      columns=[f"C{idx:02d}" for idx in range(30)])
+    return create_heatmap(df, False, False)
+
+
+def test_level_of_detail_html_without_detail_labels(tmp_path, monkeypatch):
+    fig = lod_heatmap(monkeypatch)
+    # Hover labels of the detail are built by the page from the axes ticks
+    assert fig.data[0].customdata is None and fig.layout.meta['lod']['detail_labels']
+    for compact in (False, True):
+        monkeypatch.setattr(defs, 'HTML_COMPACT', compact)
+        directory = tmp_path / str(compact)
+        export_figures({'heatmap': fig}, ['html'], directory, directory / '.export_manifest.json')
+        html = (directory / 'heatmap.html').read_text()
+        assert 'setupLevelOfDetail(' in html and 'l19' in html
+        assert (directory / 'heatmap.detail.js').exists() == compact
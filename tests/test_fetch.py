@@ -0,0 +1,157 @@
+import pytest
+import requests
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import defs
+import fakewiki
+import retrieval
+
+from fakewiki import SyntheticDataset, serve, get_urls
+from retrieval import PAGE_INFO_KEYS, TIMESTAMP_FORMAT
+from storage import save_to_file, load_from_file
+from utils import strip_url
+
+LOOKUPS_DIR = Path(__file__).resolve().parents[1] / 'data' / 'lookup_jsons'
+
+
+def sequential_steps_2_3(cuisines_raw):
+    """Steps 2-3 with one blocking call per page (as before the fetch engine)"""
+    cuisines = {}
+    for kk, vv in cuisines_raw.items():
+        params = {'action': 'query', 'format': 'json', 'prop': 'langlinks|info', 'llprop': 'url', 'lllimit': 'max',
+                  'pageids': vv['pageid']}
+        res_info, links = {}, []
+        while True:
+            res = requests.post(defs.WIKI_API_URL.format('en.wikipedia.org'), params).json()
+            res_info = res['query']['pages'][vv['pageid']]
+            links += res_info.get('langlinks', [])
+            if 'continue' not in res:
+                break
+            params.update(res['continue'])
+        languages = {ll['lang']: {'title': ll['*'], 'wiki_url': strip_url(ll['url'])} for ll in links}
+        if links:
+            languages['en'] = {key: res_info[key] for key in PAGE_INFO_KEYS if key in res_info}
+            languages['en']['title'] = res_info['title']
+        for lang, page in languages.items():
+            if lang == 'en':
+                continue
+            params = {'action': 'query', 'format': 'json', 'prop': 'info', 'redirects': 1, 'titles': page['title']}
+            res = requests.post(defs.WIKI_API_URL.format(page['wiki_url']), params).json()
+            page_data = next(iter(res['query']['pages'].values()))
+            page.update({key: page_data[key] for key in PAGE_INFO_KEYS if key in page_data})
+            if 'length' in page_data and page_data['title'] != page['title']:
+                page['canonical_title'] = page_data['title']
+        cuisines[kk] = {**vv, 'languages': languages}
+    return cuisines
+
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Few langlinks per response, so that batches of pageids need continuation
+    monkeypatch.setattr(fakewiki, 'LANGLINKS_PER_RESPONSE', 40)
+    dataset = SyntheticDataset(120, 6, density=0.6, lookups_dir=LOOKUPS_DIR, aliases=True)
+    server = serve(dataset)
+    monkeypatch.setattr(defs, 'WIKI_API_URL', get_urls(server.server_address[1])[0])
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(defs, 'DATA_SOURCE', 'api')
+    yield dataset, server
+    server.shutdown()
+
+
+def test_engine_matches_sequential_calls(wiki):
+    dataset, server = wiki
+    cuisines_raw = {cuisine: {'pageid': str(row + 1), 'languages': {}} for row, cuisine in enumerate(dataset.cuisines)}
+    save_to_file('data/cuisines_raw', cuisines_raw)
+    retrieval.step2_populate_other_languages()
+    retrieval.step3_fill_lengths()
+    engine_calls = list(server.calls)
+    assert load_from_file('data/cuisines_length') == sequential_steps_2_3(cuisines_raw)
+
+    # Batches of at most 50 pageids/titles: 3 of pageids (with continuation) and 2 of titles for every language
+    batches = [params.get('pageids', params.get('titles', '')).split('|') for _, params in engine_calls]
+    assert max(len(batch) for batch in batches) == 50
+    assert any('llcontinue' in params for _, params in engine_calls)
+    titles_calls = [host for host, params in engine_calls if 'titles' in params]
+    assert len(titles_calls) == 2 * len(dataset.languages)
+    # Normalized and redirected titles are mapped back to the titles of the langlinks
+    lengths = load_from_file('data/cuisines_length')
+    aliased = 0
+    for (col, title), row in dataset.titles.items():
+        page = lengths[dataset.cuisines[row]]['languages'][dataset.languages[col][0]]
+        aliased += page['title'] != title
+        assert page['title'] == dataset.get_link_title(row, col)
+        assert page['length'] == dataset.lengths[row, col]
+    assert aliased > 0
+
+
+def retrieve(dataset, incremental=False):
+    """Steps 2-3 of the whole dataset"""
+    cuisines_raw = {cuisine: {'pageid': str(row + 1), 'languages': {}} for row, cuisine in enumerate(dataset.cuisines)}
+    save_to_file('data/cuisines_raw', cuisines_raw)
+    retrieval.step2_populate_other_languages()
+    retrieval.step3_fill_lengths(incremental)
+
+
+def edit_pages(dataset, server, timestamp):
+    """Edit a few pages, among which ones whose langlink is normalized or redirected, return their (row, col)"""
+    edited = {}
+    for (col, title), row in dataset.titles.items():
+        if (row + col) % 5 not in edited:
+            edited[(row + col) % 5] = (row, col)
+            dataset.lengths[row, col] += 100
+            dataset.revisions[row, col] += 1
+            server.recent_changes.append((f"{dataset.languages[col][0]}.wikipedia.org", timestamp, title))
+    return list(edited.values())
+
+
+def assert_lengths(dataset):
+    lengths = load_from_file('data/cuisines_length')
+    for (col, title), row in dataset.titles.items():
+        page = lengths[dataset.cuisines[row]]['languages'][dataset.languages[col][0]]
+        assert page['length'] == dataset.lengths[row, col]
+
+
+def test_refresh_requests_only_changed_pages(wiki):
+    dataset, server = wiki
+    retrieve(dataset)
+    edited = edit_pages(dataset, server, datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT))
+    server.calls.clear()
+    retrieval.step3_fill_lengths(incremental=True)
+
+    assert sum(params.get('list') == 'recentchanges' for _, params in server.calls) == len(dataset.languages)
+    requested = {(host, title) for host, params in server.calls if 'titles' in params
+                 for title in params['titles'].split('|')}
+    assert requested == {(f"{dataset.languages[col][0]}.wikipedia.org", dataset.get_link_title(row, col))
+                         for row, col in edited}
+    assert_lengths(dataset)
+
+
+def test_refresh_offline(wiki, monkeypatch):
+    dataset, server = wiki
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', True)
+    retrieve(dataset)
+    monkeypatch.setattr(defs, 'OFFLINE', True)
+    server.calls.clear()
+    # Changes can't be listed: every page is read from the cache
+    retrieve(dataset, incremental=True)
+    assert not server.calls
+    assert_lengths(dataset)
+
+
+def test_refresh_after_cached_retrieval(wiki, monkeypatch):
+    dataset, server = wiki
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', True)
+    retrieve(dataset)
+    # Pages changed after their info was cached, before a retrieval served from the cache
+    an_hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).strftime(TIMESTAMP_FORMAT)
+    edited = edit_pages(dataset, server, an_hour_ago)
+    retrieval.step3_fill_lengths()
+    row, col = edited[0]
+    lengths = load_from_file('data/cuisines_length')
+    assert lengths[dataset.cuisines[row]]['languages'][dataset.languages[col][0]]['length'] != dataset.lengths[row, col]
+
+    retrieval.step3_fill_lengths(incremental=True)
+    assert_lengths(dataset)
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+import time
+
+from pathlib import Path
+
+import defs
+import fetch
+
+from fakewiki import SyntheticDataset, Throttle, serve, get_urls
+from governor import HostGovernor, RequestGovernor
+
+LOOKUPS_DIR = Path(__file__).resolve().parents[1] / 'data' / 'lookup_jsons'
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(defs, 'OFFLINE', False)
+    monkeypatch.setattr(defs, 'FETCH_INITIAL_PER_HOST', 4)
+    monkeypatch.setattr(defs, 'FETCH_MAX_PER_HOST', 8)
+    monkeypatch.setattr(defs, 'FETCH_BACKOFF_BASE', 0.01)
+    # Only throttling shrinks the window (latencies of a local server are too noisy)
+    monkeypatch.setattr(defs, 'FETCH_LATENCY_FACTOR', 1000.0)
+    monkeypatch.setattr(fetch, 'GOVERNOR', RequestGovernor())
+
+
+@pytest.mark.parametrize('kind', ['429', '503', 'maxlag'])
+def test_governor_backs_off_and_recovers(settings, kind):
+    throttle = Throttle(kind, calls=6, retry_after=0.05)
+    server = serve(SyntheticDataset(20, 5, lookups_dir=LOOKUPS_DIR), latency=0.005,
+                   throttle=throttle)
+    api_url = get_urls(server.server_address[1])[0].format('en.wikipedia.org')
+    governor = fetch.GOVERNOR.get('en.wikipedia.org', defs.FETCH_MAX_PER_HOST)
+    limits, release = [], governor.release
+
+    def recording_release(*args, **kwargs):
+        release(*args, **kwargs)
+        limits.append(governor.limit)
+
+    governor.release = recording_release
+    try:
+        with fetch.FetchEngine(cache=None) as engine:
+            params = {'action': 'query', 'format': 'json', 'titles': 'Italian cuisine'}
+
+            async def post_all():
+                return await asyncio.gather(*[engine.post('en.wikipedia.org', api_url, params) for _ in range(80)])
+
+            results = engine.run(post_all())
+    finally:
+        server.shutdown()
+    assert all(res is not None and 'query' in res for res in results)
+    assert throttle.throttled == 6
+    # Halved down to a single call in flight, then back to the maximum
+    assert min(limits) == 1.0
+    assert limits[-1] == defs.FETCH_MAX_PER_HOST
+
+
+def test_waiting_calls_are_woken_by_release(settings):
+    governor = HostGovernor(1)
+    governor.limit = 1.0
+    order = []
+
+    async def call(name):
+        await governor.acquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        governor.release()
+
+    async def main():
+        await asyncio.gather(*[call(idx) for idx in range(5)])
+
+    asyncio.run(asyncio.wait_for(main(), timeout=5))
+    assert sorted(order) == list(range(5))
+    assert governor.in_flight == 0
+
+
+def test_slot_freed_on_cancellation_and_errors(settings):
+    governor = fetch.GOVERNOR.get('example.org', defs.FETCH_MAX_PER_HOST)
+
+    def slow_request(host, method, url, params):
+        time.sleep(0.2)
+
+    def broken_request(host, method, url, params):
+        raise ValueError("Broken call")
+
+    with fetch.FetchEngine() as engine:
+
+        async def cancel():
+            task = asyncio.ensure_future(engine.request('example.org', 'GET', 'https://example.org'))
+            await asyncio.sleep(0.05)
+            assert governor.in_flight == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        engine._request = slow_request
+        engine.run(cancel())
+        assert governor.in_flight == 0
+        engine._request = broken_request
+        with pytest.raises(ValueError):
+            engine.run(engine.request('example.org', 'GET', 'https://example.org'))
+        assert governor.in_flight == 0
@@ -0,0 +1,51 @@
+import numpy as np
+
+from pathlib import Path
+
+import defs
+import history
+
+from fakewiki import SyntheticDataset, serve, get_urls
+from journal import Journal
+from storage import save_to_file
+
+LOOKUPS_DIR = Path(__file__).resolve().parents[1] / 'data' / 'lookup_jsons'
+
+
+def test_deltas_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    cube = np.cumsum(rng.integers(0, 3, (7, 5, 6)) * (rng.random((7, 5, 6)) < 0.2), axis=2)
+    rows, cols, snapshots, deltas = history.encode_deltas(cube)
+    assert len(deltas) == np.count_nonzero(np.diff(cube, axis=2, prepend=0))
+    history.save_history(tmp_path / 'history.npz', cube, [*'abcdefg'], [*'vwxyz'], [str(idx) for idx in range(6)])
+    loaded, row_labels, col_labels, dates = history.load_history(tmp_path / 'history.npz')
+    np.testing.assert_array_equal(loaded, cube)
+    assert row_labels == [*'abcdefg'] and col_labels == [*'vwxyz'] and dates == [str(idx) for idx in range(6)]
+
+
+def test_resume_discards_a_journal_of_other_dates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dataset = SyntheticDataset(5, 3, density=1.0, lookups_dir=LOOKUPS_DIR)
+    server = serve(dataset)
+    monkeypatch.setattr(defs, 'WIKI_API_URL', get_urls(server.server_address[1])[0])
+    monkeypatch.setattr(defs, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(defs, 'HISTORY_END', '2026-01-01')
+    monkeypatch.setattr(defs, 'HISTORY_SNAPSHOTS', 4)
+    records = {
+        cuisine: {'languages': {'en': {'title': cuisine},
+                                'l000': {'title': dataset.get_title(row, 0), 'wiki_url': 'l000.wikipedia.org'}}}
+        for row, cuisine in enumerate(dataset.cuisines)
+    }
+    save_to_file('data/cuisines_langs', records)
+    try:
+        history.step_history()
+        expected = history.load_history(defs.HISTORY_FILE)[0]
+        # Interrupted run with other dates: its lengths must not be mixed with the new snapshots
+        with Journal('data/history').open() as journal:
+            journal.append(history.JOURNAL_DATES_KEY, ['2020-01-01T00:00:00Z'] * 4)
+            journal.append(f'en.wikipedia.org|{dataset.cuisines[0]}', [1, 2, 3, 4])
+        history.step_history(resume=True)
+    finally:
+        server.shutdown()
+    np.testing.assert_array_equal(history.load_history(defs.HISTORY_FILE)[0], expected)
+    assert expected[:, :, -1].min() > 0
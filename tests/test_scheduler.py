@@ -0,0 +1,46 @@
+import pytest
+
+from scheduler import Step, Scheduler
+from storage import save_to_file, load_from_file
+
+
+def make_steps(calls, value):
+    def produce():
+        calls.append('produce')
+        save_to_file('data/a', {'value': value})
+
+    def consume():
+        calls.append('consume')
+        save_to_file('data/b', {'value': load_from_file('data/a')['value']})
+
+    return [Step(produce, outputs=['data/a']), Step(consume, inputs=['data/a'], outputs=['data/b'])]
+
+
+def test_adopted_output_is_rebuilt_when_inputs_are_regenerated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Outputs produced before the scheduler was used, without a recorded state
+    save_to_file('data/b', {'value': 'stale'})
+    calls = []
+    scheduler = Scheduler(make_steps(calls, 'new'))
+    assert [reason is not None for _, reason in scheduler.plan()] == [True, True]
+    scheduler.run()
+    assert calls == ['produce', 'consume']
+    assert load_from_file('data/b') == {'value': 'new'}
+
+
+def test_up_to_date_steps_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    Scheduler(make_steps(calls, 'new')).run()
+    Scheduler(make_steps(calls, 'new')).run()
+    assert calls == ['produce', 'consume']
+
+
+def test_circular_dependencies_raise(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    steps = [Step(print, inputs=['data/b'], outputs=['data/a'], name='a'),
+             Step(print, inputs=['data/a'], outputs=['data/b'], name='b')]
+    with pytest.raises(ValueError):
+        Scheduler(steps).plan()
+    with pytest.raises(ValueError):
+        Scheduler(steps).run()
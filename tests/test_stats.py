@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from stats import top_k, get_top_voices
+
+
+def iterrows_top_voices(df_full, k, per_cuisine):
+    """Top voices as computed before the top-k selection (one row at a time, stable sorts)"""
+    voices = []
+    for cuisine, rw in df_full.iterrows():
+        row = rw.to_frame('length').sort_values('length', ascending=False, kind='stable')[0:per_cuisine]
+        for lang, length in row['length'].items():
+            if not np.isnan(length):
+                voices.append({'cuisine': cuisine, 'language': lang, 'length': length})
+    df = pd.DataFrame(voices).sort_values('length', ascending=False, kind='stable')[0:k].reset_index(drop=True)
+    return df.astype({'length': int})
+
+
+def ties_frame(seed):
+    rng = np.random.default_rng(seed)
+    # Few distinct lengths, so that there are ties within cuisines and at the cutoffs
+    values = rng.choice([1000.0, 2000.0, 3000.0, 5000.0], size=(12, 7))
+    values[rng.random(values.shape) < 0.35] = np.nan
+    values[3] = np.nan
+    return pd.DataFrame(values, index=[f"C{idx}" for idx in range(12)], columns=[f"l{idx}" for idx in range(7)])
+
+
+def test_top_voices_match_iterrows():
+    for seed in range(20):
+        df = ties_frame(seed)
+        for k, per_cuisine in ((10, 3), (5, 1), (100, 7), (3, 10)):
+            pd.testing.assert_frame_equal(get_top_voices(df, k, per_cuisine), iterrows_top_voices(df, k, per_cuisine),
+                                          check_index_type=False)
+
+
+def test_top_k_ties_and_nan():
+    values = np.array([[3.0, np.nan, 5.0, 3.0, 3.0], [np.nan, np.nan, 1.0, np.nan, np.nan]])
+    assert top_k(values, 3).tolist() == [2, 0, 3]
+    assert top_k(values, 10).tolist() == [2, 0, 3, 4, 7]
+    assert top_k(values, 2, axis=1).tolist() == [[2, 0], [2, 0]]
+    assert top_k(values, 1, axis=0).tolist() == [[0, 0, 0, 0, 0]]
+    assert top_k(np.full(4, np.nan), 2).tolist() == []
@@ -0,0 +1,61 @@
+import numpy as np
+import pickle
+import pandas as pd
+import pytest
+
+from storage import exists, load_from_file, save_to_file, iter_records
+
+
+def test_records_round_trip_non_ascii(tmp_path):
+    records = {'Japanese cuisine': {'languages': {'ja': {'title': '日本料理', 'wiki_url': 'ja.wikipedia.org'}}},
+               'Cuisine of Réunion': {'languages': {}}}
+    save_to_file(tmp_path / 'records', records)
+    assert load_from_file(tmp_path / 'records') == records
+    partial = load_from_file(tmp_path / 'records', keys=['Cuisine of Réunion'])
+    assert partial == {'Cuisine of Réunion': {'languages': {}}}
+    assert dict(iter_records(tmp_path / 'records')) == records
+
+
+def test_legacy_pickles_are_migrated(tmp_path):
+    records = {'Italian cuisine': {'pageid': '1', 'languages': {'ja': {'title': 'イタリア料理', 'length': 5}}}}
+    df = pd.DataFrame({'ja': [5.0]}, index=pd.Index(['Italian'], name='Cuisine'))
+    with open(tmp_path / 'records.dat', 'wb') as fp:
+        pickle.dump(records, fp)
+    with open(tmp_path / 'table.dat', 'wb') as fp:
+        pickle.dump(df, fp)
+    assert exists(tmp_path / 'records') and exists(tmp_path / 'table')
+    assert load_from_file(tmp_path / 'records') == records
+    pd.testing.assert_frame_equal(load_from_file(tmp_path / 'table'), df)
+    assert not exists(tmp_path / 'missing')
+
+
+def test_exists_doesnt_migrate(tmp_path):
+    with open(tmp_path / 'records.dat', 'wb') as fp:
+        pickle.dump({'Italian cuisine': {'languages': {}}}, fp)
+    assert exists(tmp_path / 'records')
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['records.dat']
+    load_from_file(tmp_path / 'records')
+    assert (tmp_path / 'records.jsonl').exists()
+
+
+def test_tables_are_memory_mapped(tmp_path):
+    df = pd.DataFrame(np.arange(12.0).reshape(4, 3), index=list('abcd'), columns=['x', 'y', 'z'])
+    save_to_file(tmp_path / 'table', df)
+    loaded = load_from_file(tmp_path / 'table')
+    pd.testing.assert_frame_equal(loaded, df)
+    base = loaded.to_numpy()
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap)
+    # Copy-on-write: the stored table isn't changed
+    loaded.iloc[0, 0] = -1
+    pd.testing.assert_frame_equal(load_from_file(tmp_path / 'table'), df)
+
+
+def test_interrupted_save_keeps_the_previous_artifact(tmp_path):
+    records = {'Italian cuisine': {'languages': {}}}
+    save_to_file(tmp_path / 'records', records)
+    with pytest.raises(TypeError):
+        save_to_file(tmp_path / 'records', {'Greek cuisine': {'languages': {}}, 'Thai cuisine': object()})
+    assert load_from_file(tmp_path / 'records') == records
+    assert not list(tmp_path.glob('*.tmp'))
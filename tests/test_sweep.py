@@ -0,0 +1,71 @@
+import json
+import numpy as np
+import pandas as pd
+
+from itertools import product
+
+import defs
+import main
+import sweep
+
+from storage import exists, load_from_file, save_to_file
+
+MIN_LENGTHS, MIN_CUISINES, MIN_LANGUAGES = [0, 3000], [5, 12], [3, 6]
+
+
+def save_cuisines(seed=0, n_cuisines=40, n_languages=15):
+    rng = np.random.default_rng(seed)
+    present = rng.random((n_cuisines, n_languages)) < rng.random(n_languages)
+    lengths = np.rint(rng.lognormal(8, 1, (n_cuisines, n_languages))).astype(int)
+    cuisines = {
+        f"C{row} cuisine": {
+            'languages': {
+                f"l{col:02d}": {
+                    'length': int(lengths[row, col])
+                }
+                for col in np.flatnonzero(present[row])
+            }
+        }
+        for row in range(n_cuisines)
+    }
+    save_to_file('data/cuisines_length', cuisines)
+
+
+def test_sweep_matches_filter_thresholds(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    save_cuisines()
+    main.main(['sweep', '--min-length', *map(str, MIN_LENGTHS), '--min-cuisines', *map(str, MIN_CUISINES),
+               '--min-languages', *map(str, MIN_LANGUAGES), '--workers', '2', '--store-tables'])
+
+    with open('results/threshold_sweep.json', encoding='utf-8') as fp:
+        results = json.load(fp)
+    assert len(results) == len(MIN_LENGTHS) * len(MIN_CUISINES) * len(MIN_LANGUAGES)
+    table = sweep.load_table()
+    for result in results:
+        thresholds = result['min_length'], result['min_cuisines'], result['min_languages']
+        filtered, passes = table.drop_below(thresholds[0]).filter_thresholds(*thresholds[1:])
+        assert (result['cuisines'], result['languages']) == filtered.shape
+        assert result['pages'] == len(filtered.values)
+        assert result['passes'] == len(passes)
+        assert result['retained_cuisines'] == filtered.row_labels
+        assert result['retained_languages'] == filtered.col_labels
+        # Filtered tables stored with --store-tables
+        file = sweep.SWEEP_TABLE_FILE.format(*thresholds)
+        assert exists(file)
+        pd.testing.assert_frame_equal(load_from_file(file),
+                                      filtered.to_dataframe(index_name='Cuisine', columns_name='Wikipedia language'))
+    assert {(result['min_length'], result['min_cuisines'], result['min_languages'])
+            for result in results} == set(product(MIN_LENGTHS, MIN_CUISINES, MIN_LANGUAGES))
+
+
+def test_sweep_defaults_to_the_settings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Restored after the test (--set overrides defs)
+    for key in ('THRESHOLD_MIN_CUISINES', 'THRESHOLD_MIN_LANGUAGES'):
+        monkeypatch.setattr(defs, key, getattr(defs, key))
+    save_cuisines()
+    main.main(['sweep', '--set', 'THRESHOLD_MIN_CUISINES=10', '--set', 'THRESHOLD_MIN_LANGUAGES=4', '--workers', '1'])
+    with open('results/threshold_sweep.json', encoding='utf-8') as fp:
+        results = json.load(fp)
+    assert [(result['min_cuisines'], result['min_languages']) for result in results] == [(10, 4)]
+    assert not exists(sweep.SWEEP_TABLE_FILE.format(results[0]['min_length'], 10, 4))
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from table import SparseTable
+
+
+def random_cuisines(seed, n_cuisines=40, n_languages=20):
+    rng = np.random.default_rng(seed)
+    present = rng.random((n_cuisines, n_languages)) < rng.uniform(0.1, 0.9, n_languages)
+    lengths = rng.integers(100, 10000, (n_cuisines, n_languages))
+    return {
+        f"C{row}": {
+            'languages': {f"l{col:02d}": {'length': int(lengths[row, col])} for col in np.flatnonzero(present[row])}
+        }
+        for row in range(n_cuisines)
+    }
+
+
+def dropna_filter(df, min_per_col, min_per_row):
+    """Step4 filter of the DataFrame (columns, then rows), repeated until nothing changes"""
+    while True:
+        filtered = df.dropna(axis=1, thresh=min_per_col)
+        filtered = filtered[filtered.notna().sum(axis=1) >= min_per_row]
+        if filtered.shape == df.shape:
+            return filtered
+        df = filtered
+
+
+def test_filter_thresholds_matches_repeated_dropna():
+    for seed in range(10):
+        table = SparseTable.from_cuisines(random_cuisines(seed)).drop_below(2000)
+        for min_per_col, min_per_row in ((5, 3), (12, 6), (15, 8), (20, 10), (0, 0)):
+            filtered, passes = table.filter_thresholds(min_per_col, min_per_row)
+            expected = dropna_filter(table.to_dataframe(), min_per_col, min_per_row)
+            pd.testing.assert_frame_equal(filtered.to_dataframe(), expected)
+            # Every pruned label is pruned once
+            pruned_rows = [label for pruned in passes for label in pruned['rows']]
+            pruned_cols = [label for pruned in passes for label in pruned['cols']]
+            assert sorted(pruned_rows + filtered.row_labels) == sorted(table.row_labels)
+            assert sorted(pruned_cols + filtered.col_labels) == sorted(table.col_labels)
+
+
+def test_filter_thresholds_order_independent():
+    rng = np.random.default_rng(0)
+    for seed in range(10):
+        cuisines = random_cuisines(seed)
+        expected, _ = SparseTable.from_cuisines(cuisines).drop_below(2000).filter_thresholds(12, 6)
+        expected = expected.to_dataframe()
+        for _ in range(3):
+            # Rows in another order, languages of every row in another order (columns are sorted by language)
+            shuffled = {}
+            for kk in rng.permutation(list(cuisines)):
+                languages = list(cuisines[kk]['languages'].items())
+                shuffled[kk] = {'languages': dict(languages[idx] for idx in rng.permutation(len(languages)))}
+            table = SparseTable.from_cuisines(shuffled)
+            # Columns in another order too
+            order = rng.permutation(table.shape[1])
+            table = SparseTable(table.row_labels, [table.col_labels[col] for col in order], table.rows,
+                                np.argsort(order)[table.cols], table.values)
+            filtered, _ = table.drop_below(2000).filter_thresholds(12, 6)
+            df = filtered.to_dataframe()
+            pd.testing.assert_frame_equal(df.loc[expected.index, expected.columns], expected)
+            assert df.shape == expected.shape
+
+
+def test_threshold_masks_reuse_the_cells_index():
+    table = SparseTable.from_cuisines(random_cuisines(1)).drop_below(2000)
+    first = table.threshold_masks(12, 6)
+    table.threshold_masks(5, 3)
+    # Counts of the shared index aren't consumed by a filtering
+    second = table.threshold_masks(12, 6)
+    assert np.array_equal(first[0], second[0]) and np.array_equal(first[1], second[1])
+    assert np.array_equal(table._cells_index[0], table.counts()[0])
@@ -4,89 +4,37 @@
 Various utility functions
 """
 import emoji
-import json
-import pickle
+import pandas as pd
 import re
 
 from itertools import islice
-from pathlib import Path
+
+from lookups import LOOKUPS
 
 
 def get_flags_from_demonyms(country_demonyms):
     """Return a list of flags that correspond with the provided list of demonyms (adjectives)"""
-    country_demonyms_lookup = json.load(open(Path('data/lookup_jsons/lookup_countries_demonyms.json'), 'r'))[0]
-    flags = []
-    for demonym in country_demonyms:
-        try:
-            country = country_demonyms_lookup[demonym].replace(' ', '_').replace('Cuisine of ', '')
-            flag = emoji.emojize(f':{country}:', use_aliases=True)
-            if flag == f':{country}:':
-                flag = emoji.emojize(f':flag_for_{country}:', use_aliases=True)
-            flags.append(flag)
-        except KeyError:
-            flags.append(f"{demonym}")
-            print(f"Error getting flag for {demonym}")
-
-    return flags
+    return LOOKUPS.get_flags(list(country_demonyms))
 
 
 def get_languages_names(language_prefixes):
     """Return a list of extended language names given a list of 2-letters prefixes"""
-    language_names = []
-    lang_lookup_wl = load_from_file(Path('data/wiki_languages.dat'))
-    lang_lookup_wl_dict = {kk: vv['eng_name'] for kk, vv in lang_lookup_wl.items()}
-    for lang in language_prefixes:
-        try:
-            language_names.append(f"{lang_lookup_wl_dict[lang]}")
-        except KeyError:
-            language_names.append(f"{lang}")
-
-    return language_names
-
-
-def check_if_diagonal_value(mm, nn):
-    """Check if cuisine and languages match and return cell text"""
-    mm = emoji.demojize(mm, delimiters=('<<', '>>'))
-    mm = re.sub(r'<<.*?>>', '', mm).strip()
-
-    # From demonym to country
-    country_demonyms_lookup = json.load(open(Path('data/lookup_jsons/lookup_countries_demonyms.json'), 'r'))[0]
-    try:
-        country = country_demonyms_lookup[mm]
-    except KeyError:
-        print(f"Unknown key ({mm})")
-        return ''
-    # From country to language
-    country_languages_lookup = json.load(open(Path('data/lookup_jsons/lookup_countries_languages.json'), 'r'))[0]
-    try:
-        language = country_languages_lookup[country]
-    except KeyError:
-        print(f"Unknown key ({country})")
-        return ''
-    if language.lower() == nn.lower():
-        return '<b>●</b>'
-    else:
-        return ''
-
-
-def execute_steps(STEPS, steps_to_run):
-    """Run the specified program steps"""
-    for step_idx in steps_to_run:
-        print(f"Running {STEPS[step_idx].__name__}...")
-        STEPS[step_idx]()
+    return LOOKUPS.get_languages_names(list(language_prefixes))
 
 
-def save_to_file(file, obj):
-    """Pickle the object and dump it to file"""
-    with open(file, 'wb') as fp:
-        pickle.dump(obj, fp)
+def strip_emojis(text):
+    """Remove emojis (e.g.: flags) from the text"""
+    text = emoji.demojize(text, delimiters=('<<', '>>'))
+    return re.sub(r'<<.*?>>', '', text).strip()
 
 
-def load_from_file(file):
-    """Load a pickled object"""
-    with open(file, 'rb') as fp:
-        obj = pickle.load(fp)
-    return obj
+def get_diagonal_cells(cuisines, languages):
+    """Return the (cuisine, language) pairs where the language is the one spoken in the country of the cuisine"""
+    native_languages = LOOKUPS.get_native_languages([strip_emojis(cuisine) for cuisine in cuisines])
+    df_cuisines = pd.DataFrame({'cuisine': cuisines, 'key': native_languages})
+    df_languages = pd.DataFrame({'language': languages, 'key': [language.lower() for language in languages]})
+    cells = df_cuisines.dropna().merge(df_languages, on='key')
+    return list(zip(cells['cuisine'], cells['language']))
 
 
 def strip_url(text):
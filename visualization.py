@@ -9,8 +9,10 @@ import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
-from pathlib import Path
-from utils import get_flags_from_demonyms, get_languages_names, check_if_diagonal_value, load_from_file
+from analysis import get_order, get_stored_correlation
+from export import export_figures
+from stats import store_statistics
+from utils import get_flags_from_demonyms, get_languages_names, get_diagonal_cells
 
 import defs
 
@@ -28,16 +30,130 @@ CUMULATIVE_GRAPHS_LAYOUT = {'xaxis': {'tickangle': 60,
                             'plot_bgcolor': 'rgb(245,245,250)'}
 # yapf: disable
 
-def create_heatmap(df, ADD_FLAGS, DIAGONAL_MARKERS, REMOVE_CUISINE_OF=False):
-    """Create an heatmap to correlate cuisines and languages"""
+def get_tiles(labels, groups, tile_size):
+    """Return the order of the labels and start and name of every tile (consecutive labels in the same group)
+
+    Without groups, tiles are blocks of tile_size labels
+    """
+    if groups:
+        order = sorted(range(len(labels)), key=lambda idx: (labels[idx] not in groups, groups.get(labels[idx], '')))
+        keys = [groups.get(labels[idx], 'Other') for idx in order]
+        starts = [idx for idx in range(len(keys)) if idx == 0 or keys[idx] != keys[idx - 1]]
+        return order, starts, [keys[start] for start in starts]
+    starts = list(range(0, len(labels), tile_size))
+    names = [f"{labels[start]} – {labels[min(start + tile_size, len(labels)) - 1]}" for start in starts]
+    return list(range(len(labels))), starts, names
+
+
+def aggregate_tiles(z, row_starts, col_starts):
+    """Return the mean of the values (NaN excluded) in every tile"""
+    valid = ~np.isnan(z)
+    sums = np.add.reduceat(np.add.reduceat(np.where(valid, z, 0), row_starts, axis=0), col_starts, axis=1)
+    counts = np.add.reduceat(np.add.reduceat(valid.astype(np.int64), row_starts, axis=0), col_starts, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def add_summary_tiles(fig, tiles, xlabels, ylabels, row_starts, col_starts, row_names, col_names, heatmap_style,
+                      detail_labels=False):
+    """Add the summary tiles as first view, on the (numeric) axes of the detail heatmap
+
+    Zooming in or the buttons switch to the detail heatmap, labelled through the axes ticks. If detail_labels, the
+    page builds the hover labels of the detail from the ticks (export.LOD_JS). In compact HTML the detail is loaded
+    when first shown
+    """
+    row_edges = [start - 0.5 for start in row_starts] + [len(ylabels) - 0.5]
+    col_edges = [start - 0.5 for start in col_starts] + [len(xlabels) - 0.5]
+    # yapf: disable
+    fig.add_trace(go.Heatmap(x=col_edges,
+                             y=row_edges,
+                             z=tiles,
+                             customdata=[[[row_name, col_name] for col_name in col_names] for row_name in row_names],
+                             hovertemplate="Cuisines: %{customdata[1]}<br>Wikipedia languages: %{customdata[0]}<br>"
+                                           "Mean page length: %{z:.0f}<extra></extra>",
+                             showscale=False,
+                             **heatmap_style))
+    summary_visible = [False] * (len(fig.data) - 1) + [True]
+    detail_visible = [True] * (len(fig.data) - 1) + [False]
+    summary_layout = {'xaxis.tickvals': [(lo + hi) / 2 for lo, hi in zip(col_edges, col_edges[1:])],
+                      'xaxis.ticktext': col_names,
+                      'yaxis.tickvals': [(lo + hi) / 2 for lo, hi in zip(row_edges, row_edges[1:])],
+                      'yaxis.ticktext': row_names}
+    detail_layout = {'xaxis.tickvals': list(range(len(xlabels))),
+                     'xaxis.ticktext': xlabels,
+                     'yaxis.tickvals': list(range(len(ylabels))),
+                     'yaxis.ticktext': ylabels}
+    for trace, visible in zip(fig.data, summary_visible):
+        trace.visible = visible
+    fig.update_layout(summary_layout,
+                      meta={'lod': {'summary_visible': summary_visible, 'detail_visible': detail_visible,
+                                    'summary_layout': summary_layout, 'detail_layout': detail_layout,
+                                    'detail_labels': detail_labels}},
+                      updatemenus=[{'type': 'buttons', 'direction': 'left', 'x': 0, 'y': 0, 'yanchor': 'top',
+                                    'buttons': [{'label': 'Summary', 'method': 'update',
+                                                 'args': [{'visible': summary_visible}, summary_layout]},
+                                                {'label': 'Detail', 'method': 'update',
+                                                 'args': [{'visible': detail_visible}, detail_layout]}]}])
+    # yapf: enable
+
+
+def add_snapshots_slider(fig, snapshots, tiles=None):
+    """Add a frame for every snapshot of the heatmap (and of its summary tiles), selected by a slider or played"""
+    # Detail heatmap is the first trace, summary tiles (if any) the last one
+    traces = [0, len(fig.data) - 1] if tiles else [0]
+    frames = []
+    for name, values in snapshots.items():
+        data = [{'type': fig.data[0].type, 'z': values}]
+        if tiles:
+            data.append({'type': fig.data[-1].type, 'z': tiles[name]})
+        frames.append(go.Frame(name=name, data=data, traces=traces))
+    fig.frames = frames
+    # yapf: disable
+    step = {'mode': 'immediate', 'frame': {'duration': 0, 'redraw': True}, 'transition': {'duration': 0}}
+    play = {**step, 'frame': {'duration': defs.HISTORY_FRAME_DURATION, 'redraw': True}, 'fromcurrent': True}
+    fig.update_layout(sliders=[{'active': len(frames) - 1,
+                                'currentvalue': {'prefix': 'Date: '},
+                                'pad': {'t': 20, 'l': 60},
+                                'steps': [{'label': name, 'method': 'animate', 'args': [[name], step]}
+                                          for name in snapshots]}],
+                      updatemenus=[*fig.layout.updatemenus,
+                                   {'type': 'buttons',
+                                    'showactive': False,
+                                    'x': 0, 'y': 0, 'xanchor': 'left', 'yanchor': 'top',
+                                    'pad': {'t': 30},
+                                    'buttons': [{'label': 'Play', 'method': 'animate', 'args': [None, play]}]}],
+                      margin={'b': 100})
+    # yapf: enable
+
+
+def create_heatmap(df, ADD_FLAGS, DIAGONAL_MARKERS, REMOVE_CUISINE_OF=False, snapshots=None, correlations=None):
+    """Create an heatmap to correlate cuisines and languages
+
+    Snapshots ({name: values with the rows and columns of df}) are shown as frames, selected by a slider.
+    Correlations (between rows, between columns, ordered as df) are used for the clustering instead of computing them
+    """
+    # Position in df of every row/column, reordered as df (snapshots are then reordered the same way)
+    row_pos, col_pos = pd.Series(np.arange(df.shape[0]), index=df.index), np.arange(df.shape[1])
     if defs.Y_REPLACE_LANGUAGES_ABBREVIATIONS:
         languages = df.index.to_list()
         renaming_map = {lang: name for lang, name in zip(languages, get_languages_names(languages))}
         df.rename(index=renaming_map, inplace=True)
         df.sort_index(ascending=False, inplace=True)
-    rows = []
-    for idx, row in df.iterrows():
-        rows.append(row.to_list())
+        row_pos = row_pos.rename(index=renaming_map).sort_index(ascending=False)
+    if defs.HEATMAP_ORDER == 'clustering':
+        # Correlated languages/cuisines next to each other
+        z = df.to_numpy(dtype=np.float64)
+        row_corr, col_corr = correlations or (None, None)
+        if row_corr is not None:
+            row_corr = row_corr[np.ix_(row_pos.to_numpy(), row_pos.to_numpy())]
+        row_cluster, col_cluster = get_order(z.T, corr=row_corr), get_order(z, corr=col_corr)
+        df = df.iloc[row_cluster, col_cluster]
+        row_pos, col_pos = row_pos.iloc[row_cluster], col_pos[col_cluster]
+    z = df.to_numpy(dtype=np.float64)
+    snapshots_z = {
+        name: np.asarray(values, dtype=np.float64)[np.ix_(row_pos.to_numpy(), col_pos)]
+        for name, values in (snapshots or {}).items()
+    }
     xlabels = df.columns.to_list()
     ylabels = df.index.to_list()
 
@@ -66,28 +182,56 @@ def create_heatmap(df, ADD_FLAGS, DIAGONAL_MARKERS, REMOVE_CUISINE_OF=False):
             new_xlabels.append(cuisine.replace('Cuisine of ',''))
         xlabels = new_xlabels
 
+    # Summary tiles, consecutive cuisines/languages in the same group are aggregated (groups are kept together).
+    # Cells are then placed on numeric axes, shared by detail and summary, the labels being the axes ticks
+    lod = z.size >= defs.HEATMAP_LOD_MIN_CELLS
+    x, y = xlabels, ylabels
+    if lod:
+        col_order, col_starts, col_names = get_tiles(df.columns.to_list(), defs.HEATMAP_CUISINES_GROUPS,
+                                                     defs.HEATMAP_TILE_SIZE)
+        row_order, row_starts, row_names = get_tiles(df.index.to_list(), defs.HEATMAP_LANGUAGES_GROUPS,
+                                                     defs.HEATMAP_TILE_SIZE)
+        z = z[np.ix_(row_order, col_order)]
+        snapshots_z = {name: values[np.ix_(row_order, col_order)] for name, values in snapshots_z.items()}
+        xlabels = [xlabels[idx] for idx in col_order]
+        ylabels = [ylabels[idx] for idx in row_order]
+        x, y = np.arange(len(xlabels)), np.arange(len(ylabels))
+
     # yapf: disable
-    fig_hm = go.Figure(
-        data=go.Heatmap(x=xlabels,
-                        y=ylabels,
-                        z=rows,
-                        zmin=38,
-                        colorscale=defs.HEATMAP_COLORSCALE_BLUE,
-                        colorbar={'tick0': defs.THRESHOLD_MIN_VOICE_LENGTH,
-                                  'dtick': 40000},
-                        hovertemplate="Cuisine: %{x}<br>Wikipedia language: %{y}<br>Page length: %{z}<extra></extra>"))
-    annotations=[]
+    heatmap_style = {'zmin': 38,
+                     'colorscale': defs.HEATMAP_COLORSCALE_BLUE,
+                     'colorbar': {'tick0': defs.THRESHOLD_MIN_VOICE_LENGTH, 'dtick': 40000}}
+    if z.size >= defs.HEATMAP_WEBGL_MIN_CELLS:
+        # WebGL heatmap (no hover template)
+        fig_hm = go.Figure(data=go.Heatmapgl(x=x, y=y, z=z, **heatmap_style))
+    elif lod:
+        # Numeric axes, hover labels of every cell ([language, cuisine]) built by the page from the axes ticks
+        fig_hm = go.Figure(
+            data=go.Heatmap(x=x,
+                            y=y,
+                            z=z,
+                            hovertemplate="Cuisine: %{customdata[1]}<br>Wikipedia language: %{customdata[0]}<br>"
+                                          "Page length: %{z}<extra></extra>",
+                            **heatmap_style))
+    else:
+        fig_hm = go.Figure(
+            data=go.Heatmap(x=x,
+                            y=y,
+                            z=z,
+                            hovertemplate="Cuisine: %{x}<br>Wikipedia language: %{y}<br>"
+                                          "Page length: %{z}<extra></extra>",
+                            **heatmap_style))
     if DIAGONAL_MARKERS:
-        for n, (row, ylabel) in enumerate(zip(rows, ylabels)):
-            for m, (val, xlabel) in enumerate(zip(row, xlabels)):
-                if text := check_if_diagonal_value(xlabel, ylabel):
-                    annotations.append(go.layout.Annotation(text=text,
-                                                            font={'color': 'white', 'size': 16},
-                                                            x=xlabels[m],
-                                                            y=ylabels[n],
-                                                            xref='x1',
-                                                            yref='y1',
-                                                            showarrow=False))
+        # All markers in a single text trace (instead of an annotation per marker)
+        diagonal_cells = get_diagonal_cells(xlabels, ylabels)
+        x_of, y_of = dict(zip(xlabels, x)), dict(zip(ylabels, y))
+        fig_hm.add_trace(go.Scatter(x=[x_of[xlabel] for xlabel, _ in diagonal_cells],
+                                    y=[y_of[ylabel] for _, ylabel in diagonal_cells],
+                                    mode='text',
+                                    text='<b>●</b>',
+                                    textfont={'color': 'white', 'size': 16},
+                                    hoverinfo='skip',
+                                    showlegend=False))
     fig_hm.update_layout(xaxis={'title': {'text': 'CUISINES','font': {'size': defs.TEXT_SIZE_AXIS_TITLE}},
                                 'side': 'top',
                                 'tickangle': -60,
@@ -98,9 +242,16 @@ def create_heatmap(df, ADD_FLAGS, DIAGONAL_MARKERS, REMOVE_CUISINE_OF=False):
                          xaxis_showgrid=False,
                          yaxis_showgrid=False,
                          margin={'l': 0, 'r': 0, 't': 0, 'b': 20},
-                         plot_bgcolor='rgb(245,245,250)',
-                         annotations=annotations)
+                         plot_bgcolor='rgb(245,245,250)')
     # yapf: enable
+    if lod:
+        add_summary_tiles(fig_hm, aggregate_tiles(z, row_starts, col_starts), xlabels, ylabels, row_starts, col_starts,
+                          row_names, col_names, heatmap_style, detail_labels=isinstance(fig_hm.data[0], go.Heatmap))
+    if snapshots_z:
+        tiles = None
+        if lod:
+            tiles = {name: aggregate_tiles(values, row_starts, col_starts) for name, values in snapshots_z.items()}
+        add_snapshots_slider(fig_hm, snapshots_z, tiles)
     return fig_hm
 
 
@@ -145,17 +296,18 @@ def create_bar_sum_languages(df_full):
     # yapf: enable
 
 
-def step5_create_plots(df, df_full):
-    """Produce and store graphs/plots"""
+def create_figures(df, df_full):
+    """Create the enabled graphs/plots, by name"""
     figures = {}
     pd.options.plotting.backend = 'plotly'
 
     # Prepare data frames
     df = df.transpose()
-    df_full = df_full.drop(['cuisine'], axis=1)
+    df_full = df_full.drop(['cuisine'], axis=1, errors='ignore')
 
-    # Create heatmap
-    fig_hm = create_heatmap(df, defs.X_ADD_FLAGS, defs.MARKER_ON_DIAGONAL_CELLS)
+    # Create heatmap (clustered with the correlations stored by step 4)
+    correlations = (get_stored_correlation('languages', df.index), get_stored_correlation('cuisines', df.columns))
+    fig_hm = create_heatmap(df, defs.X_ADD_FLAGS, defs.MARKER_ON_DIAGONAL_CELLS, correlations=correlations)
     figures['correlation_heatmap'] = fig_hm
 
     # Create full heatmap
@@ -173,54 +325,16 @@ def step5_create_plots(df, df_full):
     if defs.PRODUCE_HISTOGRAM:
         fig_hist = df_full.hist()
         figures['historgram'] = fig_hist
+    return figures
+
+
+def step5_create_plots(df, df_full):
+    """Produce and store graphs/plots"""
+    figures = create_figures(df, df_full)
 
     # Create statistics
     if defs.STORE_STATISTICS:
-        pd.set_option('display.float_format', '{:.0f}'.format)
-        pd.set_option('display.max_rows', None)
-        pd.set_option('display.max_colwidth', None)
-        # Cuisine leaderboard
-        sum_data = df_full.transpose().sum().astype(int)
-        leaderboard = sum_data.to_frame('length').sort_values('length', ascending=False)[0:30]
-        leaderboard.index = [
-            f"{flag} {cuisine}"
-            for flag, cuisine in zip(get_flags_from_demonyms(leaderboard.index), leaderboard.index.to_list())
-        ]
-        with open(Path(f'results/cuisines_leaderboard.md'), 'w') as fp:
-            fp.write(leaderboard.to_markdown())
-        # Top voices
-        cc2 = load_from_file('data/cuisines_langs.dat')
-        df_topvoices = pd.DataFrame(columns=['cuisine', 'language', 'length', 'url'])
-        # yapf: disable
-        for cuisine, rw in df_full.iterrows():
-            for lang, length in rw.to_frame('length').sort_values('length',ascending=False)[0:3]['length'].iteritems():
-                if not np.isnan(length):
-                    df_topvoices = df_topvoices.append({'cuisine': cuisine,
-                                                        'language': lang,
-                                                        'length': length,},
-                                                       ignore_index=True)
-        # yapf: enable
-        df_topvoices = df_topvoices.sort_values('length', ascending=False)[0:10]
-        df_topvoices.reset_index(drop=True, inplace=True)
-        urls = {}
-        for idx, row in df_topvoices.iterrows():
-            wikipage = cc2[f'{row["cuisine"]} cuisine']['languages'][row['language']]
-            if row['language'] == 'en':
-                wikiurl = 'en.wikipedia.org'
-            else:
-                wikiurl = wikipage['wiki_url']
-            urls[idx] = f'[{row["cuisine"]} cuisine ({row["language"]})]' + '(https://' + wikiurl + '/wiki/' + wikipage[
-                'title'].replace(' ', '_') + ')'
-        for kk, vv in urls.items():
-            df_topvoices['url'][kk] = vv
-        df_topvoices['cuisine'] = [
-            f"{flag} {cuisine}" for flag, cuisine in zip(get_flags_from_demonyms(df_topvoices['cuisine']),
-                                                         df_topvoices['cuisine'].to_list())
-        ]
-        df_topvoices['language'] = get_languages_names(df_topvoices['language'])
-
-        with open(Path(f'results/cuisines_top.md'), 'w') as fp:
-            fp.write(df_topvoices.to_markdown())
+        store_statistics(df_full.drop(['cuisine'], axis=1, errors='ignore'))
 
     # Show plots in-browser
     if defs.SHOW_RESULTS:
@@ -228,13 +342,5 @@ def step5_create_plots(df, df_full):
             fig.show()
 
     # Store results (html/images)
-    Path('results').mkdir(parents=True, exist_ok=True)
-    for fig_name, fig in figures.items():
-        if defs.STORE_HTML:
-            with open(Path(f'results/{fig_name}.html'), 'w+') as fp:
-                fp.write(fig.to_html())
-        if defs.STORE_IMAGE:
-            # Remove axes titles for image
-            fig.update_layout(xaxis={'title': {'text': ''}}, yaxis={'title': {'text': ''}})
-            with open(Path(f'results/{fig_name}.jpg'), 'wb+') as fp:
-                fp.write(fig.to_image(format='jpg', width=1920, height=1080, scale=2.0))
+    formats = (['html'] if defs.STORE_HTML else []) + (defs.IMAGE_FORMATS if defs.STORE_IMAGE else [])
+    export_figures(figures, formats)
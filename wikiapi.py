@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+MediaWiki API helpers
+"""
+import asyncio
+
+from utils import split_to_chunks
+
+import defs
+
+# Maximum number of titles/pageids accepted by a single query (non-bot users)
+MAX_TITLES_PER_QUERY = 50
+
+
+class QueryError(Exception):
+    """An API call of a query failed"""
+
+
+def get_api_url(wiki_url):
+    """Return the API endpoint of the given xyz.wikipedia.org host"""
+    return defs.WIKI_API_URL.format(wiki_url)
+
+
+async def query(engine, wiki_url, params, strict=False, stop=None):
+    """Perform an API query following 'continue', return the list of responses
+
+    If a call fails, the responses already received are returned (QueryError is raised instead if strict).
+    The query isn't continued after a response for which stop(response) is True
+    """
+    api_url = get_api_url(wiki_url)
+    params = {**params, 'action': 'query', 'format': 'json', 'maxlag': defs.FETCH_MAXLAG}
+    responses = []
+    while True:
+        res = await engine.post(wiki_url, api_url, params)
+        if res is None:
+            if strict:
+                raise QueryError(f"Query to {api_url} failed ({params})")
+            break
+        responses.append(res)
+        if 'continue' not in res or (stop and stop(res)):
+            break
+        params.update(res['continue'])
+    return responses
+
+
+def merge_page(page, page_data):
+    """Merge a (partial) page returned by a continued query into the already collected one"""
+    for kk, vv in page_data.items():
+        if isinstance(vv, list):
+            page.setdefault(kk, []).extend(vv)
+        else:
+            page[kk] = vv
+
+
+async def get_chunk_info(engine, wiki_url, titles, params, strict=False):
+    """Return the data of at most MAX_TITLES_PER_QUERY pages, keyed by the title as requested"""
+    renames = {}
+    chunk_pages = {}
+    for res in await query(engine, wiki_url, {**params, 'titles': '|'.join(titles)}, strict):
+        for mapping in ('normalized', 'redirects'):
+            for entry in res.get('query', {}).get(mapping, []):
+                renames[entry['from']] = entry['to']
+        for page_data in res.get('query', {}).get('pages', {}).values():
+            merge_page(chunk_pages.setdefault(page_data['title'], {}), page_data)
+    pages = {}
+    for title in titles:
+        resolved = title
+        # Follow normalization first, then redirects (bounded in case of loops)
+        for _ in range(len(renames) + 1):
+            if resolved not in renames:
+                break
+            resolved = renames[resolved]
+        if resolved in chunk_pages:
+            pages[title] = chunk_pages[resolved]
+    return pages
+
+
+async def get_pages_info(engine, wiki_url, titles, prop='info', extra_params=None, strict=False):
+    """Return the data of every page, keyed by the title as requested (normalized/redirected titles are mapped back)"""
+    params = {'prop': prop, 'redirects': 1, **(extra_params or {})}
+    chunks = split_to_chunks(list(dict.fromkeys(titles)), MAX_TITLES_PER_QUERY)
+    pages = {}
+    chunks_pages = await asyncio.gather(*[get_chunk_info(engine, wiki_url, chunk, params, strict) for chunk in chunks])
+    for chunk_pages in chunks_pages:
+        pages.update(chunk_pages)
+    return pages
+
+
+async def get_pageids_chunk_info(engine, wiki_url, pageids, params, strict=False):
+    """Return the data of at most MAX_TITLES_PER_QUERY pages, keyed by pageid"""
+    pages = {}
+    for res in await query(engine, wiki_url, {**params, 'pageids': '|'.join(pageids)}, strict):
+        for pageid, page_data in res.get('query', {}).get('pages', {}).items():
+            merge_page(pages.setdefault(pageid, {}), page_data)
+    return pages
+
+
+async def get_pageids_info(engine, wiki_url, pageids, prop='info', extra_params=None, strict=False):
+    """Return the data of every page, keyed by pageid (partial pages returned by continued queries are merged)"""
+    params = {'prop': prop, **(extra_params or {})}
+    chunks = split_to_chunks([str(pageid) for pageid in dict.fromkeys(pageids)], MAX_TITLES_PER_QUERY)
+    pages = {}
+    chunks_pages = await asyncio.gather(
+        *[get_pageids_chunk_info(engine, wiki_url, chunk, params, strict) for chunk in chunks])
+    for chunk_pages in chunks_pages:
+        pages.update(chunk_pages)
+    return pages
+
+
+async def get_revisions(engine, wiki_url, title, start, end, strict=False):
+    """Return timestamp and size of the revisions of a page from start back to end, and of the last one before end
+
+    Timestamps are ISO 8601 (2023-04-12T09:30:11Z), revisions are sorted from the oldest. Revisions in a time range can
+    only be queried for one page at a time (rvstart/rvend/rvlimit are single-page parameters)
+    """
+    params = {
+        'prop': 'revisions',
+        'titles': title,
+        'redirects': 1,
+        'rvprop': 'timestamp|size',
+        'rvlimit': 'max',
+        'rvstart': start,
+        'rvdir': 'older'
+    }
+
+    def reached_end(res):
+        return any(rev['timestamp'] < end for page in res.get('query', {}).get('pages', {}).values()
+                   for rev in page.get('revisions', []))
+
+    revisions = []
+    for res in await query(engine, wiki_url, params, strict, stop=reached_end):
+        for page in res.get('query', {}).get('pages', {}).values():
+            revisions.extend(page.get('revisions', []))
+    return sorted(revisions, key=lambda rev: rev['timestamp'])
+
+
+async def get_recent_changes(engine, wiki_url, since, max_calls=None, namespace=0):
+    """Return the titles of the pages changed (edited, created, moved or deleted) since the given timestamp
+
+    None is returned if the changes don't fit in max_calls calls
+    """
+    params = {
+        'list': 'recentchanges',
+        'rcend': since,
+        'rcnamespace': namespace,
+        'rctype': 'edit|new|log',
+        'rcprop': 'title',
+        'rclimit': 'max'
+    }
+    calls = 0
+
+    def reached_max_calls(res):
+        nonlocal calls
+        calls += 1
+        return max_calls is not None and calls >= max_calls
+
+    responses = await query(engine, wiki_url, params, strict=True, stop=reached_max_calls)
+    if 'continue' in responses[-1]:
+        return None
+    return {change['title'] for res in responses for change in res.get('query', {}).get('recentchanges', [])}
+
+
+async def get_category_members(engine, wiki_url, category, namespace=0):
+    """Return pageid and title of every page in a category"""
+    params = {'list': 'categorymembers', 'cmtitle': category, 'cmnamespace': namespace, 'cmlimit': 'max'}
+    members = []
+    for res in await query(engine, wiki_url, params):
+        members.extend(res.get('query', {}).get('categorymembers', []))
+    return members